@@ -1,6 +1,6 @@
 import streamlit as st
 from modules import ui
-from modules.data_loader import get_prices, load_units, attach_usd_values, load_historic_data
+from modules.startup import run_startup, prefetch_historic
 from modules.filters import _init_global_filters, _opts
 from modules.sidebar_info import render_sidebar
 from analytics import init_analytics
@@ -15,15 +15,14 @@ init_analytics()
 if "initialized" not in st.session_state:
     loader = ui.show_global_loader("Initializing Crypto Treasury Tracker")
 
-    # fetch prices once with cache ttl
-    st.session_state["prices"] = get_prices()  # (BTC, ETH, XRP, BNB, SOL)
+    # prices and units fetched concurrently; historic data is loaded on demand (Trends)
+    boot = run_startup()
+    st.session_state["prices"] = boot["prices"]  # (BTC, ETH, SOL, SUI, LTC, XRP, HYPE)
+    st.session_state["prices_as_of"] = boot["prices_as_of"]
+    st.session_state["dataset_version"] = boot["dataset_version"]
+    st.session_state["data_df"] = boot["data_df"]
+    st.session_state["startup_timings"] = boot["timings"]
 
-    # load units once with cache ttl
-    units_df = load_units()
-    st.session_state["units_df"] = units_df
-
-    # compute USD values once per price snapshot
-    st.session_state["data_df"] = attach_usd_values(units_df, st.session_state["prices"])
     _init_global_filters(st.session_state["data_df"])
     print(st.session_state["data_df"].head(10))
     # canonical option lists used by ALL pages
@@ -43,10 +42,10 @@ if "initialized" not in st.session_state:
             a for a in st.session_state["flt_assets"] if a in st.session_state["opt_assets"]
         ] or st.session_state["opt_assets"]
 
-    # load historic data
-    st.session_state["historic_df"] = load_historic_data()
-
     st.session_state["initialized"] = True
     loader.empty()
 
-render_sidebar()
\ No newline at end of file
+render_sidebar()
+
+# warm historic data in the background after first paint
+prefetch_historic()
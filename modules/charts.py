@@ -4,6 +4,13 @@ import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
 from plotly.colors import qualitative
+from modules.filter_index import filtered_view
+from modules.cube import get_cube, rollup
+from modules.nav_matrix import get_nav_matrix
+from modules.entity_snapshot import get_entity_snapshot
+from modules.history_matrix import history_matrix, history_with_live
+from modules.view_cache import derived
+from modules.formatting import format_usd, usd_labels, int_labels, join_lines, hover_blocks
 
 
 ASSETS_ORDER = ["BTC","ETH","SOL","XRP","BNB","SUI","LTC", "HYPE"]  # stable order for stacking/colors
@@ -20,54 +27,34 @@ COLOR_MAP = {k: f"rgb({r},{g},{b})" for k, (r, g, b) in TYPE_PALETTE.items()}
 
 WATERMARK_TEXT="cryptotreasurytracker.xyz"
 
-def format_usd(value):
-    if value >= 1_000_000_000_000:
-        return f"${value/1_000_000_000_000:.1f}T"
-    if value >= 1_000_000_000:
-        return f"${value/1_000_000_000:.1f}B"
-    elif value >= 1_000_000:
-        return f"${value/1_000_000:.1f}M"
-    elif value >= 1_000:
-        return f"${value/1_000:.1f}K"
-    else:
-        return f"${value:.0f}"
-
-
 def render_world_map(df, asset_filter, type_filter, value_range_filter):
 
-    filtered = df.copy()
-
     # Asset filter accepts list or 'All'
-    if asset_filter != "All":
-        if isinstance(asset_filter, list):
-            if len(asset_filter) == 0:
-                # nothing selected, return an empty chart-friendly frame
-                filtered = filtered.iloc[0:0]
-            else:
-                filtered = filtered[filtered["Crypto Asset"].isin(asset_filter)]
-        else:
-            filtered = filtered[filtered["Crypto Asset"] == asset_filter]
-
     if isinstance(asset_filter, list) and len(asset_filter) == 0:
         st.info("No data for the current filters.")
         return None
+    if asset_filter == "All":
+        assets = None
+    else:
+        assets = asset_filter if isinstance(asset_filter, list) else [asset_filter]
 
-    
-    # Entity type
-    if type_filter != "All":
-        filtered = filtered[filtered["Entity Type"] == type_filter]
+    # asset + entity type via the precomputed filter index (memoized per filter)
+    filtered = filtered_view(df, assets, entity_type=type_filter, positive=False)
 
     # Guard 1 empty after filtering
     if filtered.empty:
         st.info("No data for the current filters.")
         return None
     
-    # Group first
-    grouped = filtered.groupby("Country").agg(
-        Total_USD=("USD Value", "sum"),
-        Entity_Count=("Entity Name", "nunique"),
-        Avg_Holdings=("USD Value", "mean")
-    ).reset_index()
+    # Group first (rolled up from the aggregate cube of this view)
+    cube = get_cube(filtered)
+    grouped = rollup(cube, ["Country"], entities=True)
+    grouped = pd.DataFrame({
+        "Country": grouped["Country"],
+        "Total_USD": grouped["USD Value"],
+        "Entity_Count": grouped["Entities"],
+        "Avg_Holdings": grouped["USD Value"] / grouped["Rows"],
+    })
 
     # Guard 2 empty after grouping
     if grouped.empty:
@@ -91,13 +78,12 @@ def render_world_map(df, asset_filter, type_filter, value_range_filter):
     assets_in_scope = list(filtered["Crypto Asset"].dropna().unique())
 
     # Global USD across all selected assets/types (for % of global)
-    total_global_usd = float(filtered["USD Value"].sum())
+    total_global_usd = float(cube["USD Value"].sum())
 
     # Per-country, per-asset aggregation
     per_country_asset = (
-        filtered.groupby(["Country", "Crypto Asset"])
-        .agg(Units=("Holdings (Unit)", "sum"), USD=("USD Value", "sum"))
-        .reset_index()
+        rollup(cube, ["Country", "Crypto Asset"])
+        .rename(columns={"Holdings (Unit)": "Units", "USD Value": "USD"})
     )
 
     # Map country -> HTML lines for hover
@@ -117,13 +103,13 @@ def render_world_map(df, asset_filter, type_filter, value_range_filter):
                 lines.append(f"{asset}: <b>{fmt_units(u)}</b> ({format_usd(usd)})")
         lines_by_country[country] = "<br>".join(lines) if lines else "—"
 
-    grouped["PerAssetBreakdown"] = grouped["Country"].map(lines_by_country)
+    grouped["PerAssetBreakdown"] = grouped["Country"].map(lines_by_country).astype(object)
     grouped["Share_Global"] = grouped["Total_USD"] / total_global_usd if total_global_usd > 0 else 0.0
     grouped["Formatted_Share_Global"] = grouped["Share_Global"].apply(lambda x: f"{x:.1%}")
     
     # Format values for display
-    grouped["Formatted_Total_USD"] = grouped["Total_USD"].apply(format_usd)
-    grouped["Formatted_Avg_Holdings"] = grouped["Avg_Holdings"].apply(format_usd)
+    grouped["Formatted_Total_USD"] = usd_labels(grouped["Total_USD"])
+    grouped["Formatted_Avg_Holdings"] = usd_labels(grouped["Avg_Holdings"])
 
     # Prepare custom hover data columns
     grouped["Custom_Hover"] = (
@@ -185,7 +171,7 @@ def render_rankings(df, asset="BTC", by="units"):
     d = df[df["Crypto Asset"] == asset]
 
     top = (
-        d.groupby("Entity Name", as_index=False)
+        d.groupby("Entity Name", as_index=False, observed=True)
         .agg(Holdings=("Holdings (Unit)", "sum"),
              USD_Value=("USD Value", "sum"))
         .sort_values("Holdings" if by == "units" else "USD_Value", ascending=False)
@@ -243,55 +229,25 @@ def render_rankings(df, asset="BTC", by="units"):
 
 
 def historic_chart(df, by="USD"):
-    # Ensure numeric
-    df['USD Value'] = pd.to_numeric(df['USD Value'], errors='coerce')
-    if 'Holdings (Unit)' in df.columns:
-        df['Holdings (Unit)'] = pd.to_numeric(df['Holdings (Unit)'], errors='coerce')
-
     value_col = 'USD Value' if by == "USD" else 'Holdings (Unit)'
 
-    # Aggregate monthly totals
-    grouped = (
-        df.groupby(['Date', 'Crypto Asset'])
-        .agg({value_col: 'sum', 'USD Value': 'sum'})
-        .reset_index()
-    )
+    # Monthly totals per asset (shared, prepared once per historic view)
+    grouped = history_matrix(df).long()
 
-    # Build hover templates
-    if by == "USD":
-        breakdowns = (
-            grouped.groupby('Date')
-            .apply(lambda d: (
-                f"<b>{d.name.strftime('%B %Y')}</b><br>" +
-                "<br>".join([
-                    f"{row['Crypto Asset']}: <b>{format_usd(row['USD Value'])}</b>"
-                    for _, row in d.iterrows()
-                ]) +
-                f"<br>Total: <b>{format_usd(d['USD Value'].sum())}</b>"
-            ))
-            .to_dict()
-        )
-        grouped['Text'] = grouped[value_col].apply(format_usd)
-    else:
-        breakdowns = (
-            grouped.groupby('Date')
-            .apply(lambda d: (
-                f"<b>{d.name.strftime('%B %Y')}</b><br>" +
-                "<br>".join([
-                    f"{row['Crypto Asset']}: <b>{int(row[value_col]):,}</b>"
-                    for _, row in d.iterrows()
-                ]) +
-                f"<br>Total: <b>{int(d[value_col].sum()):,}</b>"
-            ))
-            .to_dict()
-        )
-        grouped['Text'] = grouped[value_col].apply(lambda x: f"{int(x):,}")
+    # Build hover templates (one vectorized pass, joined per month)
+    labels = usd_labels if by == "USD" else int_labels
+    hover_col = 'USD Value' if by == "USD" else value_col
+    totals = grouped.groupby('Date')[hover_col].sum()
+    breakdowns = hover_blocks(
+        grouped['Date'],
+        grouped['Crypto Asset'].astype(str).to_numpy(dtype=object) + ": <b>" + labels(grouped[hover_col]) + "</b>",
+        title=lambda d: d.strftime('%B %Y'),
+        footer=pd.Series("Total: <b>" + labels(totals) + "</b>", index=totals.index),
+    )
+    grouped['Text'] = labels(grouped[value_col])
 
     grouped['Custom Hover'] = grouped['Date'].map(breakdowns)
 
-    max_date = df['Date'].max()
-    grouped = grouped[grouped['Date'] <= max_date]
-
     # Build figure
     fig = px.bar(
         grouped,
@@ -358,59 +314,24 @@ def historic_chart(df, by="USD"):
     return fig
 
 
-def _first_day_next_month(dt: pd.Timestamp) -> pd.Timestamp:
-    dt = pd.Timestamp(dt).normalize()
-    return (dt + pd.offsets.MonthBegin(1))
-
-
-def _prepare_hist_with_snapshot(df_historic: pd.DataFrame, current_df: pd.DataFrame | None):
-    dfh = df_historic.copy()
-    dfh["USD Value"] = pd.to_numeric(dfh["USD Value"], errors="coerce").fillna(0.0)
-    dfh["Holdings (Unit)"] = pd.to_numeric(dfh.get("Holdings (Unit)"), errors="coerce").fillna(0.0)
-    dfh["Crypto Asset"] = dfh["Crypto Asset"].astype(str).str.upper()
-
-    selected_assets = [a for a in ASSETS_ORDER if a in dfh["Crypto Asset"].unique()]
-    if not selected_assets:
-        return pd.DataFrame(), selected_assets
-
-    hist = (
-        dfh.groupby(["Date","Crypto Asset"], as_index=False)
-           .agg({"USD Value":"sum","Holdings (Unit)":"sum"})
-    )
-    last_hist_month = hist["Date"].max() if not hist.empty else pd.Timestamp.today().normalize()
-
-    if current_df is not None and not current_df.empty:
-        snap = current_df.copy()
-        snap["Crypto Asset"] = snap["Crypto Asset"].astype(str).str.upper()
-        snap["USD Value"] = pd.to_numeric(snap["USD Value"], errors="coerce").fillna(0.0)
-        snap["Holdings (Unit)"] = pd.to_numeric(snap.get("Holdings (Unit)"), errors="coerce").fillna(0.0)
-        snap = snap.groupby("Crypto Asset", as_index=False).agg({"USD Value":"sum","Holdings (Unit)":"sum"})
-        snap["Date"] = _first_day_next_month(last_hist_month)
-        hist = pd.concat([hist, snap[["Date","Crypto Asset","USD Value","Holdings (Unit)"]]], ignore_index=True)
-
-    # filter & stable order
-    hist = hist[hist["Crypto Asset"].isin(selected_assets)]
-    rank = {a:i for i,a in enumerate(ASSETS_ORDER)}
-    hist = hist.sort_values(["Date","Crypto Asset"], key=lambda s: s.map(rank).fillna(999))
-    return hist, selected_assets
-
-
 # --- left: Cumulative Market Cap (USD) ---
 def cumulative_market_cap_chart(df_historic: pd.DataFrame, current_df: pd.DataFrame | None = None):
-    hist, selected_assets = _prepare_hist_with_snapshot(df_historic, current_df)
+    hist = history_with_live(df_historic, current_df)
+    selected_assets = [a for a in ASSETS_ORDER if a in hist.usd.columns]
     fig = go.Figure()
-    if hist.empty:
+    if not selected_assets:
         return fig
 
-    totals = hist.groupby("Date", as_index=True)["USD Value"].sum().reset_index().sort_values("Date")
+    usd = hist.usd[selected_assets]
+    totals = usd.sum(axis=1, min_count=1).dropna()
 
     if len(selected_assets) == 1:
         a = selected_assets[0]
-        s = (hist[hist["Crypto Asset"] == a].sort_values("Date")[["Date","USD Value","Holdings (Unit)"]])
+        s = pd.DataFrame({"USD Value": usd[a], "Holdings (Unit)": hist.units[a]}).dropna()
 
         # Units area (left axis)
         fig.add_trace(go.Scatter(
-            x=s["Date"], y=s["Holdings (Unit)"],
+            x=s.index, y=s["Holdings (Unit)"],
             mode="lines",
             line=dict(width=0, color=COLORS.get(a, "#888")),
             fill="tozeroy",
@@ -420,7 +341,7 @@ def cumulative_market_cap_chart(df_historic: pd.DataFrame, current_df: pd.DataFr
         ))
         # USD line (right axis)
         fig.add_trace(go.Scatter(
-            x=s["Date"], y=s["USD Value"],
+            x=s.index, y=s["USD Value"],
             mode="lines",
             line=dict(width=3, color=COLORS.get(a, "#ff9393")),
             name=f"{a} Total USD Value",
@@ -450,10 +371,9 @@ def cumulative_market_cap_chart(df_historic: pd.DataFrame, current_df: pd.DataFr
 
     else:
         # Multi-asset → one total USD line + per-asset USD lines
-        series = totals.reset_index().sort_values("Date")
         # total: solid, thicker
         fig.add_trace(go.Scatter(
-            x=series["Date"], y=series["USD Value"],
+            x=totals.index, y=totals.values,
             mode="lines",
             line=dict(width=3, dash="solid", color="#ffffff"),
             name="Total",
@@ -461,11 +381,9 @@ def cumulative_market_cap_chart(df_historic: pd.DataFrame, current_df: pd.DataFr
         ))
         # per-asset lines: thinner, dashed, asset colors
         for a in selected_assets:
-            s = (hist[hist["Crypto Asset"] == a]
-                .groupby("Date", as_index=False)["USD Value"].sum()
-                .sort_values("Date"))
+            s = usd[a].dropna()
             fig.add_trace(go.Scatter(
-                x=s["Date"], y=s["USD Value"],
+                x=s.index, y=s.values,
                 mode="lines",
                 line=dict(width=1.8, dash="dot", color=COLORS.get(a, "#888")),
                 name=f"{a}",
@@ -499,13 +417,13 @@ def cumulative_market_cap_chart(df_historic: pd.DataFrame, current_df: pd.DataFr
 
 # --- right: Dominance (USD stacked area) ---
 def dominance_area_chart_usd(df_historic: pd.DataFrame, current_df: pd.DataFrame | None = None):
-    hist, selected_assets = _prepare_hist_with_snapshot(df_historic, current_df)
+    hist = history_with_live(df_historic, current_df)
+    selected_assets = [a for a in ASSETS_ORDER if a in hist.usd.columns]
     fig = go.Figure()
-    if hist.empty:
+    if not selected_assets:
         return fig
 
-    usds = hist.pivot(index="Date", columns="Crypto Asset", values="USD Value").fillna(0.0)
-    usds = usds.reindex(columns=selected_assets)
+    usds = hist.usd[selected_assets].dropna(how="all").fillna(0.0)
     totals_usd = usds.sum(axis=1)
 
     cum = None
@@ -548,23 +466,20 @@ def dominance_area_chart_usd(df_historic: pd.DataFrame, current_df: pd.DataFrame
 
 def holdings_by_entity_type_bar(df):
     # Step 1: Group by Entity Type and Crypto Asset
-    grouped = (
-        df.groupby(['Entity Type', 'Crypto Asset'])['USD Value']
-        .sum()
-        .reset_index()
-    )
+    grouped = rollup(get_cube(df), ['Entity Type', 'Crypto Asset'])[['Entity Type', 'Crypto Asset', 'USD Value']]
 
     # Step 2: Build custom hover text per Entity Type
-    breakdowns = (
-        grouped.groupby('Entity Type')
-        .apply(lambda d: f"<b>{d.name}</b><br>" + "<br>".join(
-            [f"{row['Crypto Asset']}: <b>{format_usd(row['USD Value'])}</b>" for _, row in d.sort_values('USD Value', ascending=False).iterrows()])
-        ).to_dict()
-    )
+    def _hover(_):
+        rows = grouped.sort_values('USD Value', ascending=False, kind='stable')
+        return hover_blocks(
+            rows['Entity Type'],
+            rows['Crypto Asset'].astype(str).to_numpy(dtype=object) + ": <b>" + usd_labels(rows['USD Value']) + "</b>",
+        )
+    breakdowns = derived(df, "hover:type_asset_usd", _hover)
     grouped['Custom Hover'] = grouped['Entity Type'].map(breakdowns)
 
     # Step 3: Sort Entity Types by total USD Value descending
-    totals = grouped.groupby('Entity Type')['USD Value'].sum().sort_values(ascending=False)
+    totals = grouped.groupby('Entity Type', observed=True)['USD Value'].sum().sort_values(ascending=False)
     sorted_types = totals.index.tolist()
     grouped['Entity Type'] = pd.Categorical(grouped['Entity Type'], categories=sorted_types, ordered=True)
     grouped = grouped.sort_values(['Entity Type', 'Crypto Asset'])
@@ -645,6 +560,7 @@ def entity_type_distribution_pie(df):
     entity_type_counts = df[['Entity Name', 'Entity Type']].drop_duplicates()
     type_counts = entity_type_counts['Entity Type'].value_counts().reset_index()
     type_counts.columns = ['Entity Type', 'Count']
+    type_counts = type_counts[type_counts['Count'] > 0]  # categoricals also count unused types
     type_counts["Entity Type"] = type_counts["Entity Type"].astype(str).str.strip()
     ORDER = list(TYPE_PALETTE.keys())
 
@@ -693,14 +609,13 @@ def entity_type_distribution_pie(df):
 def top_countries_by_entity_count(df):
     # Step 1: Group by Country and Entity Type to count unique entities
     grouped = (
-        df.groupby(['Country', 'Entity Type'])['Entity Name']
-        .nunique()
-        .reset_index(name='Entity Count')
+        rollup(get_cube(df), ['Country', 'Entity Type'], entities=True)
+        .rename(columns={'Entities': 'Entity Count'})[['Country', 'Entity Type', 'Entity Count']]
     )
 
     # Step 2: Get top 5 countries by total entity count
     top_countries = (
-        grouped.groupby('Country')['Entity Count']
+        grouped.groupby('Country', observed=True)['Entity Count']
         .sum()
         .nlargest(5)
         .index.tolist()
@@ -709,12 +624,13 @@ def top_countries_by_entity_count(df):
     filtered = grouped[grouped['Country'].isin(top_countries)]
 
     # Step 3: Prepare custom hover text with aggregated breakdown per country
-    country_breakdowns = (
-        filtered.groupby('Country')
-        .apply(lambda d: f"<b>{d.name}</b><br>" + "<br>".join(
-            [f"{row['Entity Type']}: <b>{int(row['Entity Count'])}</b>" for _, row in d.sort_values('Entity Count', ascending=False).iterrows()])
-        ).to_dict()
-    )
+    def _hover(_):
+        rows = filtered.sort_values('Entity Count', ascending=False, kind='stable')
+        return hover_blocks(
+            rows['Country'],
+            rows['Entity Type'].astype(str).to_numpy(dtype=object) + ": <b>" + rows['Entity Count'].astype(int).astype(str).to_numpy(dtype=object) + "</b>",
+        )
+    country_breakdowns = derived(df, "hover:country_type_count", _hover)
 
     #filtered['Custom Hover'] = filtered['Country'].map(country_breakdowns)
     filtered = filtered.copy()
@@ -737,7 +653,7 @@ def top_countries_by_entity_count(df):
 
     # Step 5: Add total text at end of each full bar (sum by country)
     totals = (
-        filtered.groupby('Country')['Entity Count']
+        filtered.groupby('Country', observed=True)['Entity Count']
         .sum()
         .sort_values(ascending=True)  # Match y-axis order
     )
@@ -784,15 +700,11 @@ def top_countries_by_entity_count(df):
 
 def top_countries_by_usd_value(df):
     # Step 1: Group by Country and Entity Type to get USD sums
-    grouped = (
-        df.groupby(['Country', 'Entity Type'])['USD Value']
-        .sum()
-        .reset_index()
-    )
+    grouped = rollup(get_cube(df), ['Country', 'Entity Type'])[['Country', 'Entity Type', 'USD Value']]
 
     # Step 2: Get top 5 countries by total USD value
     top_countries = (
-        grouped.groupby('Country')['USD Value']
+        grouped.groupby('Country', observed=True)['USD Value']
         .sum()
         .nlargest(5)
         .index.tolist()
@@ -801,12 +713,13 @@ def top_countries_by_usd_value(df):
     filtered = grouped[grouped['Country'].isin(top_countries)]
 
     # Step 3: Prepare custom hover text with aggregated breakdown per country
-    country_breakdowns = (
-        filtered.groupby('Country')
-        .apply(lambda d: f"<b>{d.name}</b><br>" + "<br>".join(
-            [f"{row['Entity Type']}: <b>{format_usd(row['USD Value'])}</b>" for _, row in d.sort_values('USD Value', ascending=False).iterrows()])
-        ).to_dict()
-    )
+    def _hover(_):
+        rows = filtered.sort_values('USD Value', ascending=False, kind='stable')
+        return hover_blocks(
+            rows['Country'],
+            rows['Entity Type'].astype(str).to_numpy(dtype=object) + ": <b>" + usd_labels(rows['USD Value']) + "</b>",
+        )
+    country_breakdowns = derived(df, "hover:country_type_usd", _hover)
 
     filtered['Custom Hover'] = filtered['Country'].map(country_breakdowns)
     filtered['Entity Type'] = filtered['Entity Type'].astype(str).str.strip()
@@ -827,7 +740,7 @@ def top_countries_by_usd_value(df):
 
     # Step 5: Add total value at end of bar
     totals = (
-        filtered.groupby('Country')['USD Value']
+        filtered.groupby('Country', observed=True)['USD Value']
         .sum()
         .sort_values(ascending=True)
     )
@@ -876,43 +789,34 @@ def entity_ranking(df, by="USD", top_n=10):
     value_col = 'USD Value' if by == "USD" else 'Holdings (Unit)'
 
     # Step 1: Aggregate values for plotting
-    grouped = (
-        df.groupby(['Entity Name', 'Crypto Asset'])[value_col]
-        .sum()
-        .reset_index()
-    )
+    cube = get_cube(df)
+    grouped = rollup(cube, ['Entity Name', 'Crypto Asset'])[['Entity Name', 'Crypto Asset', value_col]]
 
     # Step 2: USD total ranking
     usd_totals = (
-        df.groupby('Entity Name')['USD Value']
-        .sum()
+        rollup(cube, ['Entity Name'])
+        .set_index('Entity Name')['USD Value']
         .sort_values(ascending=False)
     )
 
     # Limit to top N by USD value
     top_entities = usd_totals.head(top_n).index.tolist()
     grouped = grouped[grouped['Entity Name'].isin(top_entities)]
-    grouped["USD Total"] = grouped["Entity Name"].map(usd_totals)
+    grouped["USD Total"] = grouped["Entity Name"].map(usd_totals).astype(float)
 
     # Step 3: Hover & label formatting
-    if by == "USD":
-        grouped["Text"] = grouped[value_col].apply(format_usd)
-        hover = grouped.groupby('Entity Name').apply(
-            lambda d: f"<b>{d.name}</b><br>" + "<br>".join(
-                [f"{row['Crypto Asset']}: <b>{format_usd(row[value_col])}</b>" for _, row in d.iterrows()])
-        ).to_dict()
-    else:
-        grouped["Text"] = grouped[value_col].apply(lambda x: f"{int(x):,}")
-        hover = grouped.groupby('Entity Name').apply(
-            lambda d: f"<b>{d.name}</b><br>" + "<br>".join(
-                [f"{row['Crypto Asset']}: <b>{int(row[value_col]):,}</b>" for _, row in d.iterrows()])
-        ).to_dict()
+    labels = usd_labels if by == "USD" else int_labels
+    grouped["Text"] = labels(grouped[value_col])
+    hover = derived(df, f"hover:entity_asset:{by}:{top_n}", lambda _: hover_blocks(
+        grouped['Entity Name'],
+        grouped['Crypto Asset'].astype(str).to_numpy(dtype=object) + ": <b>" + grouped["Text"].to_numpy(dtype=object) + "</b>",
+    ))
 
     grouped['Custom Hover'] = grouped['Entity Name'].map(hover)
 
     # Step 4: Enforce x-axis sort
     sorted_entities = (
-        grouped.groupby('Entity Name')['USD Total']
+        grouped.groupby('Entity Name', observed=True)['USD Total']
         .max()
         .sort_values(ascending=False)
         .index.tolist()
@@ -994,13 +898,13 @@ def treemap_composition(df, mode: str = "country_type"):
       - "country_type": Country → Entity Type (area = USD)
       - "type_entity":  Entity Type → Entity Name (area = USD)
     """
-    d = df.copy()
-    d = d[d["USD Value"] > 0]  # guard: only positive areas
-    d["Country"] = d["Country"].fillna("Decentralized").astype(str).str.strip()
+    d = get_cube(df)
+    d = d[d["USD Value"] > 0].copy()  # guard: only positive areas
+    d["Country"] = d["Country"].astype(object).fillna("Decentralized").astype(str).str.strip()
 
     order = list(TYPE_PALETTE.keys())
     d["Entity Type"] = (
-        d["Entity Type"].fillna("Other").astype(str).str.strip().replace({"": "Other"})
+        d["Entity Type"].astype(object).fillna("Other").astype(str).str.strip().replace({"": "Other"})
     )
     d.loc[~d["Entity Type"].isin(order), "Entity Type"] = "Other"
 
@@ -1010,12 +914,10 @@ def treemap_composition(df, mode: str = "country_type"):
 
     # ---------- helper to create per-leaf UNITS lines ----------
     def _format_units_lines(grouped_units_rows, key_cols):
-        grp = grouped_units_rows.sort_values("Holdings (Unit)", ascending=False)
-        out = {}
-        for keys, sub in grp.groupby(key_cols, observed=True):
-            lines = [f"{a}: {int(u):,}".replace(",", " ") for a, u in zip(sub["Crypto Asset"], sub["Holdings (Unit)"])]
-            out[tuple(keys if isinstance(keys, tuple) else (keys,))] = "<br>".join(lines)
-        return out
+        grp = grouped_units_rows.sort_values("Holdings (Unit)", ascending=False, kind="stable")
+        lines = grp["Crypto Asset"].astype(str).to_numpy(dtype=object) + ": " + int_labels(grp["Holdings (Unit)"], sep=" ")
+        joined = join_lines([grp[c] for c in key_cols], lines)
+        return {k if isinstance(k, tuple) else (k,): v for k, v in joined.items()}
 
     if mode == "type_entity":
         # Entity Type → Entity Name
@@ -1025,10 +927,17 @@ def treemap_composition(df, mode: str = "country_type"):
         )
         units_text_map = _format_units_lines(units_rows, ["Entity Type", "Entity Name"])
 
+        # most frequent country per entity (ties: alphabetical, as Series.mode)
+        main_country = (
+            d.groupby(["Entity Type", "Entity Name", "Country"], as_index=False, observed=True)["Rows"].sum()
+             .sort_values(["Rows", "Country"], ascending=[False, True], kind="stable")
+             .drop_duplicates(["Entity Type", "Entity Name"])
+             .drop(columns="Rows")
+        )
         grouped = (
             d.groupby(["Entity Type", "Entity Name"], as_index=False, observed=True)
-             .agg(USD_Value=("USD Value", "sum"),
-                  Country=("Country", lambda x: x.mode().iat[0] if len(x) else ""))
+             .agg(USD_Value=("USD Value", "sum"))
+             .merge(main_country, on=["Entity Type", "Entity Name"], how="left")
         )
 
         fig = px.treemap(
@@ -1196,43 +1105,9 @@ def lorenz_curve_chart(p, L, asset: str | None = None):
     return fig
 
 
-def _entity_snapshot(df: pd.DataFrame) -> pd.DataFrame:
-    """
-    Collapse to one row per entity with:
-      - MarketCap  (expects column 'Market Cap')
-      - CryptoNAV  (sum of USD Value across assets)
-      - Exposure%  (CryptoNAV / MarketCap)
-      - Premium%   (uses 'Premium %' if present, else (MarketCap - MNAV)/MNAV if MNAV present)
-      - Entity Type, Country (mode)
-    """
-    g = (df.groupby("Entity Name", as_index=False)
-           .agg(**{
-               "CryptoNAV": ("USD Value", "sum"),
-               "MarketCap": ("Market Cap", "max"),
-               "Entity Type": ("Entity Type", lambda s: s.mode().iat[0] if len(s) else None),
-               "Country": ("Country", lambda s: s.mode().iat[0] if len(s) else None),
-               "MNAV": ("mNAV", lambda s: s.dropna().iloc[0] if "mNAV" in df.columns and s.dropna().size else np.nan),
-               "PremiumCol": ("Premium", lambda s: s.dropna().iloc[0] if "Premium" in df.columns and s.dropna().size else np.nan),
-           }))
-    # Exposure
-    g["Exposure %"] = np.where(g["MarketCap"] > 0, g["CryptoNAV"] / g["MarketCap"] * 100.0, np.nan)
-
-    # Premium
-    prem = g["PremiumCol"].copy()
-    if prem.isna().all() and "MNAV" in g.columns:
-        with np.errstate(divide="ignore", invalid="ignore"):
-            prem = (g["MarketCap"] - g["MNAV"]) / g["MNAV"] * 100.0
-    g["Premium %"] = prem
-
-    # Core proxy (for decomposition)
-    g["Core Proxy"] = np.maximum(g["MarketCap"] - g["CryptoNAV"], 0.0)
-
-    return g[["Entity Name","Entity Type","Country","MarketCap","CryptoNAV","Core Proxy","Exposure %","Premium %"]]
-
-
 def exposure_ladder_bar(df: pd.DataFrame, top_n: int = 20) -> go.Figure:
-    snap = _entity_snapshot(df).dropna(subset=["MarketCap"])
-    snap = snap[snap["MarketCap"] > 0].copy()
+    snap = get_entity_snapshot(df).dropna(subset=["MarketCap"])
+    snap = snap[snap["MarketCap"] > 0]
     snap = snap.sort_values("Exposure %", ascending=True).tail(top_n)
 
     DEFAULT_BAR = "#66cded"
@@ -1256,7 +1131,7 @@ def exposure_ladder_bar(df: pd.DataFrame, top_n: int = 20) -> go.Figure:
             "Crypto-NAV: %{customdata[0]}<br>"
             "Market Cap: %{customdata[1]}<extra></extra>"
         ),
-        customdata=np.c_[snap["CryptoNAV"].apply(lambda x: format_usd(x)), snap["MarketCap"].apply(lambda x: format_usd(x))],
+        customdata=np.c_[usd_labels(snap["CryptoNAV"]), usd_labels(snap["MarketCap"])],
     ))
     fig.update_layout(
         height=max(400, 25 * len(snap) + 40),
@@ -1281,13 +1156,11 @@ def exposure_ladder_bar(df: pd.DataFrame, top_n: int = 20) -> go.Figure:
 
 
 def mcap_decomposition_bar(df: pd.DataFrame, top_n: int = 20) -> go.Figure:
-    snap = _entity_snapshot(df).dropna(subset=["MarketCap"])
-    snap["Core Proxy"] = np.maximum(snap["MarketCap"] - snap["CryptoNAV"], 0.0)
-
-    snap = snap[snap["MarketCap"] > 0].copy()
+    snap = get_entity_snapshot(df).dropna(subset=["MarketCap"])
+    snap = snap[snap["MarketCap"] > 0]
 
     snap = snap.sort_values("MarketCap", ascending=True).tail(top_n)
-    total_labels = snap["MarketCap"].map(lambda x: format_usd(x))
+    total_labels = usd_labels(snap["MarketCap"])
 
     fig = go.Figure()
     fig.add_bar(
@@ -1296,7 +1169,7 @@ def mcap_decomposition_bar(df: pd.DataFrame, top_n: int = 20) -> go.Figure:
         y=snap["Entity Name"],
         orientation="h",
         marker_color="#43d1a0",
-        customdata=np.c_[snap["MarketCap"].apply(lambda x: format_usd(x)), snap["CryptoNAV"].apply(lambda x: format_usd(x)), snap["Core Proxy"].apply(lambda x: format_usd(x))],
+        customdata=np.c_[usd_labels(snap["MarketCap"]), usd_labels(snap["CryptoNAV"]), usd_labels(snap["Core Proxy"])],
         hovertemplate=(
             "<b>%{y}</b><br>"
             "Market Cap: %{customdata[0]}<br>"
@@ -1313,7 +1186,7 @@ def mcap_decomposition_bar(df: pd.DataFrame, top_n: int = 20) -> go.Figure:
         textposition="outside",
         cliponaxis=False,
         marker_color="#8892a6",
-        customdata=np.c_[snap["MarketCap"].apply(lambda x: format_usd(x)), snap["CryptoNAV"].apply(lambda x: format_usd(x)), snap["Core Proxy"].apply(lambda x: format_usd(x))],
+        customdata=np.c_[usd_labels(snap["MarketCap"]), usd_labels(snap["CryptoNAV"]), usd_labels(snap["Core Proxy"])],
         hovertemplate=(
             "<b>%{y}</b><br>"
             "Market Cap: %{customdata[0]}<br>"
@@ -1348,21 +1221,6 @@ def mcap_decomposition_bar(df: pd.DataFrame, top_n: int = 20) -> go.Figure:
 NEUTRAL_POS = "#43d1a0"
 NEUTRAL_NEG = "#f94144"
 
-def _entity_snapshot_by_asset(df: pd.DataFrame) -> pd.DataFrame:
-    """
-    Per-entity, per-asset snapshot:
-      - MarketCap (one per entity; we take max)
-      - AssetNAV = USD Value per asset
-    """
-    g = (df.groupby(["Entity Name", "Crypto Asset"], as_index=False)
-            .agg(AssetNAV=("USD Value", "sum"),
-                 MarketCap=("Market Cap", "max"),
-                 EntityType=("Entity Type", lambda s: s.mode().iat[0] if len(s) else None),
-                 Country=("Country", lambda s: s.mode().iat[0] if len(s) else None)))
-    g = g.dropna(subset=["MarketCap"])
-    g = g[g["MarketCap"] > 0]
-    return g
-
 def corporate_sensitivity_bar(
     df: pd.DataFrame,
     shock_pct: float | None = None,              # e.g. +0.10 for +10% (uniform)
@@ -1376,31 +1234,14 @@ def corporate_sensitivity_bar(
 
     If per_asset_shocks is provided, it takes precedence over shock_pct.
     """
-    snap = _entity_snapshot_by_asset(df)
-    if snap.empty:
+    nav = get_nav_matrix(df)
+    if nav.empty:
         return go.Figure()
 
-    # Pick shocks
-    if per_asset_shocks:
-        shocks = per_asset_shocks
-        # ensure missing assets get 0 shock
-        assets_present = snap["Crypto Asset"].unique().tolist()
-        shocks = {a: float(shocks.get(a, 0.0)) for a in assets_present}
-        # compute per-entity delta via sum over assets
-        deltas = (snap.assign(Shock=snap["Crypto Asset"].map(shocks).fillna(0.0))
-                       .assign(Delta=lambda x: x["AssetNAV"] * x["Shock"])
-                       .groupby("Entity Name", as_index=False)
-                       .agg(Delta_USD=("Delta", "sum"),
-                            MarketCap=("MarketCap", "max")))
-    else:
-        s = float(shock_pct or 0.0)
-        deltas = (snap.groupby("Entity Name", as_index=False)
-                       .agg(Delta_USD=("AssetNAV", lambda v: v.sum() * s),
-                            MarketCap=("MarketCap", "max")))
-
-    deltas["Impact %"] = np.where(deltas["MarketCap"] > 0,
-                                  deltas["Delta_USD"] / deltas["MarketCap"] * 100.0,
-                                  np.nan)
+    # one matrix-vector product; per-asset shocks take precedence, missing assets get 0 shock
+    delta = nav.deltas(nav.shock_vector(uniform=shock_pct, per_asset=per_asset_shocks))
+    deltas = pd.DataFrame({"Entity Name": nav.entities, "Delta_USD": delta, "MarketCap": nav.mcap,
+                           "Impact %": nav.impact(delta)})
 
     d = deltas.sort_values("Impact %", key=lambda s: s.abs()).tail(top_n)
 
@@ -1441,16 +1282,69 @@ def corporate_sensitivity_bar(
     return fig
 
 
+def monte_carlo_range_bar(table: pd.DataFrame, top_n: int = 20, lo: str = "P5", hi: str = "P95") -> go.Figure:
+    """
+    Simulated implied equity move per entity (table from monte_carlo.simulate):
+    a bar from the lo to the hi percentile, the median as a marker and the expected
+    shortfall as a cross. Shows the Top-N entities by tail risk (most negative ES).
+    """
+    if table.empty:
+        return go.Figure()
+    d = table.sort_values("Move ES %", ascending=False).tail(top_n)
+    low, high, mid = d[f"Move {lo} %"], d[f"Move {hi} %"], d["Move P50 %"]
+
+    fig = go.Figure()
+    fig.add_bar(
+        name=f"{lo}–{hi}",
+        x=high - low,
+        base=low,
+        y=d["Entity Name"],
+        orientation="h",
+        marker_color="rgba(102,205,237,0.45)",
+        customdata=np.c_[low, high, usd_labels(d[f"ΔNAV {lo}"]), usd_labels(d[f"ΔNAV {hi}"])],
+        hovertemplate=(
+            "<b>%{y}</b><br>"
+            f"{lo}: " "%{customdata[0]:+.2f}% (%{customdata[2]})<br>"
+            f"{hi}: " "%{customdata[1]:+.2f}% (%{customdata[3]})<extra></extra>"
+        ),
+    )
+    fig.add_scatter(
+        name="Median", x=mid, y=d["Entity Name"], mode="markers",
+        marker=dict(color="#ffffff", size=8, symbol="line-ns-open", line=dict(width=2)),
+        hovertemplate="<b>%{y}</b><br>Median: %{x:+.2f}%<extra></extra>",
+    )
+    fig.add_scatter(
+        name="Expected Shortfall", x=d["Move ES %"], y=d["Entity Name"], mode="markers",
+        marker=dict(color=NEUTRAL_NEG, size=8, symbol="x"),
+        customdata=usd_labels(d["ΔNAV ES"]),
+        hovertemplate="<b>%{y}</b><br>Expected Shortfall: %{x:+.2f}% (%{customdata})<extra></extra>",
+    )
+    fig.update_layout(
+        height=max(420, 24 * len(d) + 60),
+        margin=dict(l=120, r=50, t=50, b=10),
+        xaxis=dict(title="Implied Equity Move (%)", ticksuffix="%", zeroline=True),
+        yaxis=dict(title=None),
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="center", x=0.5),
+        hoverlabel=dict(align="left"),
+    )
+
+    fig.add_annotation(
+    text=WATERMARK_TEXT,
+    x=0.5, y=0.45, xref="paper", yref="paper",
+    showarrow=False, font=dict(size=35, color="white"), opacity=0.30,
+    xanchor="center", yanchor="middle",
+    )
+
+    return fig
+
+
 def mnav_comparison_bar(df: pd.DataFrame, top_n: int = 20, max_mnav: float | None = None) -> go.Figure:
     """
     Pick Top-N by CryptoNAV (largest treasuries), then DISPLAY sorted by mNAV (desc)
     with a 1× guideline. Optional mNAV cap to drop outliers.
     """
-    snap = _entity_snapshot(df).dropna(subset=["MarketCap"])
-    snap = snap[snap["MarketCap"] > 0].copy()
-
-    with np.errstate(divide="ignore", invalid="ignore"):
-        snap["mNAV"] = np.where(snap["CryptoNAV"] > 0, snap["MarketCap"] / snap["CryptoNAV"], np.nan)
+    snap = get_entity_snapshot(df).dropna(subset=["MarketCap"])
+    snap = snap[snap["MarketCap"] > 0]
 
     # Optional outlier cap BEFORE picking Top-N
     if max_mnav is not None:
@@ -0,0 +1,32 @@
+import pandas as pd
+from modules.view_cache import derived
+
+
+# Finest grain of the units frame used by the aggregate charts
+CUBE_DIMS = ["Crypto Asset", "Entity Type", "Country", "Entity Name"]
+
+
+def build_cube(df: pd.DataFrame) -> pd.DataFrame:
+    """Sums of USD Value and units plus row counts per (asset, entity type, country, entity)."""
+    return (
+        df.groupby(CUBE_DIMS, observed=True, sort=False, dropna=False)
+          .agg(**{"USD Value": ("USD Value", "sum"),
+                  "Holdings (Unit)": ("Holdings (Unit)", "sum"),
+                  "Rows": ("USD Value", "size")})
+          .reset_index()
+    )
+
+
+def get_cube(df: pd.DataFrame) -> pd.DataFrame:
+    """Cube of df, built once per cached view (per price snapshot and filter)."""
+    return derived(df, "cube", build_cube)
+
+
+def rollup(cube: pd.DataFrame, dims: list[str], entities: bool = False) -> pd.DataFrame:
+    """Roll the cube up to dims (sorted by dims): USD Value, Holdings (Unit) and Rows sums,
+    plus the distinct entity count as Entities when requested."""
+    g = cube.groupby(dims, observed=True)
+    out = g[["USD Value", "Holdings (Unit)", "Rows"]].sum()
+    if entities:
+        out["Entities"] = g["Entity Name"].nunique()
+    return out.reset_index()
@@ -1,7 +1,13 @@
 import streamlit as st
 import numpy as np
-import json, os, time, requests, gspread, pandas as pd
-from google.oauth2.service_account import Credentials
+import json, os, time, requests, pandas as pd
+from modules.sheets_client import with_spreadsheet, is_auth_error
+from modules.snapshot_cache import load_snapshot, save_snapshot, refresh_in_background
+from modules.single_flight import single_flight
+from modules.swr_cache import swr_cache
+from modules.pricing import PricingBase
+from modules.entity_history import record_snapshot
+from modules.parsing import parse_numbers, log_rejected
 
 
 CENTRAL_FILE = "data/prices.json"
@@ -53,30 +59,56 @@ SUPPLY_CAPS = {
     }
 
 
-def _batch_get_tables(sheet, ranges):
+# Dimensions of the units frame that are stored as pandas categoricals
+CATEGORY_COLUMNS = ["Entity Name", "Entity Type", "Country", "Crypto Asset"]
+
+
+def _batch_get_tables(sheet, ranges, render="FORMATTED_VALUE"):
     """Return a list of tables (each as a list-of-rows) for the given A1 ranges.
     Tries batch_get (one API call). Falls back to values_batch_get. As a last resort,
-    returns [] so caller can decide to skip or do per-sheet reads."""
+    returns [] so caller can decide to skip or do per-sheet reads.
+    Auth failures are raised, so with_spreadsheet can re-authorize and retry.
+    render="UNFORMATTED_VALUE" returns numeric cells as numbers instead of locale strings."""
     # Newer gspread
     try:
-        return sheet.batch_get(ranges, value_render_option="FORMATTED_VALUE")
-    except Exception:
-        pass
+        return sheet.batch_get(ranges, value_render_option=render)
+    except Exception as e:
+        if is_auth_error(e):
+            raise
     # Older gspread: values_batch_get
     try:
-        resp = sheet.values_batch_get(ranges, params={"valueRenderOption": "FORMATTED_VALUE"})
+        resp = sheet.values_batch_get(ranges, params={"valueRenderOption": render})
         return [vr.get("values", []) for vr in resp.get("valueRanges", [])]
-    except Exception:
+    except Exception as e:
+        if is_auth_error(e):
+            raise
         return []
 
-def _df_from_table(rows):
-    if not rows:
-        return None
-    header, data = rows[0], rows[1:]
-    width = len(header)
-    # Right-pad or trim each row to match header width
-    data_fixed = [(r + [""] * (width - len(r)))[:width] for r in data]
-    return pd.DataFrame(data_fixed, columns=header)
+def _fetch_tables(ranges):
+    """Raw (UNFORMATTED_VALUE) tables; the formatted read is only a fallback."""
+    tables = with_spreadsheet(lambda sheet: _batch_get_tables(sheet, ranges, "UNFORMATTED_VALUE"))
+    if any(tables):
+        return tables
+    print("unformatted read returned nothing, falling back to FORMATTED_VALUE")
+    return with_spreadsheet(lambda sheet: _batch_get_tables(sheet, ranges))
+
+def _frame_from_tables(tables, columns):
+    """Build one frame with only `columns` straight from the row lists of all tables.
+    Each column is gathered by header position (cells past the end of a short row read
+    as ""), so rows are never padded and unused columns are never materialized."""
+    cols = {c: [] for c in columns}
+    for rows in tables:
+        if not rows or len(rows) < 2 or not rows[0]:
+            continue
+        header, data = rows[0], rows[1:]
+        pos = {str(h).strip(): i for i, h in enumerate(header)}
+        for c in columns:
+            i = pos.get(c)
+            if i is None:
+                cols[c].extend([""] * len(data))
+            else:
+                cols[c].extend([r[i] if i < len(r) else "" for r in data])
+    return pd.DataFrame(cols, columns=columns)
 
 def ensure_dir_for(path: str):
     os.makedirs(os.path.dirname(path), exist_ok=True)
@@ -98,17 +130,12 @@ def save_last_prices(prices: dict, filename=None):
     with open(filename, "w") as f:
         json.dump(out, f)
 
-@st.cache_data(ttl=300, show_spinner=False)  # 5 minutes
-def read_central_prices_from_sheet() -> dict | None:
-    """Read latest BTC/ETH USD from Google Sheet 'prices' worksheet."""
+def _fetch_central_prices() -> dict | None:
+    """Read latest BTC/ETH USD from Google Sheet 'prices' worksheet (uncached)."""
     try:
-        import gspread
-        from google.oauth2.service_account import Credentials
-        scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-        creds = Credentials.from_service_account_info(st.secrets["gcp_service_account"], scopes=scope)
-        client = gspread.authorize(creds)
-        ws = client.open("master_table_v01").worksheet("prices")
-        rows = ws.get_all_records(value_render_option="UNFORMATTED_VALUE")  # [{'asset':'BTC','usd':65000.0,'timestamp':...}, ...]
+        rows = with_spreadsheet(
+            lambda sheet: sheet.worksheet("prices").get_all_records(value_render_option="UNFORMATTED_VALUE")
+        )  # [{'asset':'BTC','usd':65000.0,'timestamp':...}, ...]
         if not rows:
             return None
         df = pd.DataFrame(rows)
@@ -122,12 +149,27 @@ def read_central_prices_from_sheet() -> dict | None:
     except Exception:
         return None
 
-@st.cache_data(ttl=3600, show_spinner=False)
+# 5 minutes, stale value served while refreshing. get_prices (itself SWR-cached) calls
+# _fetch_central_prices directly, so its refresh never serves this cache's stale value.
+read_central_prices_from_sheet = swr_cache("central_prices", ttl=300)(_fetch_central_prices)
+
+def _last_prices_seed():
+    """Last persisted price tuple and its file time, so a new process can serve prices at once."""
+    if not os.path.exists(LOCAL_FALLBACK_FILE):
+        return None
+    last = load_last_prices()
+    if not all(a in last for a in ASSETS):
+        return None
+    return tuple(float(last[a]) for a in ASSETS), os.path.getmtime(LOCAL_FALLBACK_FILE)
+
+@swr_cache("prices", ttl=3600, seed=_last_prices_seed)
 def get_prices():
     # 1 central sheet
-    central = read_central_prices_from_sheet()  # returns keys like BTC ETH
+    central = _fetch_central_prices()  # returns keys like BTC ETH
     if central and all(a in central for a in ASSETS):
-        return tuple(float(central[a]) for a in ASSETS)
+        prices = {a: float(central[a]) for a in ASSETS}
+        save_last_prices(prices)
+        return tuple(prices[a] for a in ASSETS)
 
     # 2 CoinGecko API then persist to local
     try:
@@ -149,118 +191,94 @@ def get_prices():
     last = load_last_prices()
     return tuple(float(last.get(a, 0.0)) for a in ASSETS)
 
-# Function to get raw treasury data from master sheets
-def load_units():
-    scope = ["https://spreadsheets.google.com/feeds","https://www.googleapis.com/auth/drive"]
-    service_account_info = st.secrets["gcp_service_account"]
-    creds = Credentials.from_service_account_info(service_account_info, scopes=scope)
-    client = gspread.authorize(creds)
-    sheet = client.open("master_table_v01")
+def _parse_col(df, col, fmt, label):
+    values, rejected = parse_numbers(df[col], fmt, return_rejected=True)
+    log_rejected(f"{label}/{col}", df[col], rejected)
+    return values
 
+# Function to get raw treasury data from master sheets
+def _fetch_units():
     ranges = [f"aggregated_{a.lower()}_data!A:Z" for a in ASSETS]  # e.g., aggregated_btc_data!A:Z
-    tables = _batch_get_tables(sheet, ranges)  # one API call
-
-    dfs = []
-    for rows in tables:
-        if not rows:
-            continue
-        header, data = rows[0], rows[1:]
-        if not header or not data:
-            continue
-        df_a = _df_from_table(rows)
-        if df_a is not None and not df_a.empty:
-            dfs.append(df_a)
+    tables = _fetch_tables(ranges)  # one API call, pooled client
 
-    if not dfs:
-        return pd.DataFrame(columns=["Entity Name", "Ticker", "Market Cap", "Entity Type","Country","Crypto Asset","Holdings (Unit)"])
-
-    df = pd.concat(dfs, ignore_index=True)
-    df = df[["Entity Name", "Ticker", "Market Cap", "Entity Type","Country","Crypto Asset","Holdings (Unit)"]]
+    df = _frame_from_tables(tables, ["Entity Name", "Ticker", "Market Cap", "Entity Type","Country","Crypto Asset","Holdings (Unit)"])
     df["Ticker"] = df["Ticker"].astype(str).str.strip()
     #df["Ticker"] = df["Ticker"].replace({"None": np.nan, "": np.nan}).astype("string")
 
-    df["Market Cap"] = pd.to_numeric(df["Market Cap"], errors="coerce")  # NaN for missing
+    df["Market Cap"] = _parse_col(df, "Market Cap", "plain", "units")  # NaN for missing
+    df["Holdings (Unit)"] = _parse_col(df, "Holdings (Unit)", "eu", "units").fillna(0.0)
 
-    df["Holdings (Unit)"] = (
-        df["Holdings (Unit)"].astype(str)
-        .str.replace(".", "", regex=False)
-        .str.replace(",", ".", regex=False)
-        .astype(float)
-    )
-    df["Holdings (Unit)"] = pd.to_numeric(df["Holdings (Unit)"], errors="coerce").fillna(0.0)
+    # dictionary-encode the filter/group dimensions (group with observed=True downstream)
+    for col in CATEGORY_COLUMNS:
+        df[col] = df[col].astype(str).astype("category")
 
     return df
 
 
-def attach_usd_values(df_units: pd.DataFrame, prices_input):
-    # accept either tuple in ASSETS order or dict keyed by symbols
-    if isinstance(prices_input, tuple) or isinstance(prices_input, list):
-        price_map = dict(zip(ASSETS, map(float, prices_input)))
-    else:
-        price_map = {k.upper(): float(v) for k, v in prices_input.items()}
-
-    df = df_units.copy()
-    # 1) Calculation of total crypto treasury value in USD
-    df["USD Value"] = df["Crypto Asset"].map(price_map).fillna(0.0) * df["Holdings (Unit)"]
-
-    # 2)  mNAV multiple  -> Market Cap over crypto NAV
-    df["mNAV"] = df["Market Cap"] / df["USD Value"]
-    df.loc[df["Market Cap"].isna() | (df["Market Cap"] <= 0) | (df["USD Value"] <= 0), "mNAV"] = np.nan
-    df["mNAV"] = df["mNAV"].round(2)
-
-    # 3) Premium or Discount percent -> equals mNAV minus 1
-    df["Premium"] = ((df["Market Cap"] / df["USD Value"]) - 1) * 100
-    df.loc[df["Market Cap"].isna() | (df["Market Cap"] <= 0) | (df["USD Value"] <= 0), "Premium"] = np.nan
-    df["Premium"] = df["Premium"].round(2)
-
-    # 4) Treasury to Market Cap ratio percent -> share of company value in crypto
-    df["TTMCR"] = (df["USD Value"] / df["Market Cap"]) * 100
-    df.loc[df["Market Cap"].isna() | (df["Market Cap"] <= 0), "TTMCR"] = np.nan
-    df["TTMCR"] = df["TTMCR"].round(2)
-    
+def _load_with_snapshot(name, fetch):
+    """Serve the typed on-disk snapshot if present and refresh it from Sheets in the background.
+    Without a snapshot (first run) fetch synchronously and persist the result.
+    Sheet fetches are single-flight per dataset: concurrent sessions share one request."""
+    df, meta = load_snapshot(name)
+    if df is not None:
+        refresh_in_background(name, lambda: single_flight(name, fetch), meta)
+        return df
+
+    def _cold():
+        # a flight that just finished may already have written the snapshot
+        df, _ = load_snapshot(name)
+        if df is not None:
+            return df
+        df = fetch()
+        if not df.empty:
+            save_snapshot(name, df)
+        return df
+
+    return single_flight(name, _cold)
+
+
+def _units_seed():
+    df, meta = load_snapshot("units")
+    return None if df is None else (df, meta["saved_at"])
+
+@swr_cache("units", ttl=900, seed=_units_seed, keep=lambda df: df is not None and not df.empty)
+def load_units():
+    """Treasury units, served stale-while-revalidate; every Sheets fetch rewrites the disk snapshot."""
+    df = _fetch_units()
+    if not df.empty:
+        save_snapshot("units", df)
+        record_snapshot(df)   # entity history: appended unless unchanged
     return df
 
-# Function to get historic treasury data from master sheets
-@st.cache_data(ttl=900, show_spinner=False)
-def load_historic_data():
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    service_account_info = st.secrets["gcp_service_account"]
-    creds = Credentials.from_service_account_info(service_account_info, scopes=scope)
-    client = gspread.authorize(creds)
-    sheet = client.open("master_table_v01")
 
-    ranges = [f"historic_{a.lower()}!A:Z" for a in ASSETS]  # e.g., historic_btc!A:Z
-    tables = _batch_get_tables(sheet, ranges)  # one API call
+def price_map(prices_input) -> dict:
+    """{asset: price} from either a tuple in ASSETS order or a dict keyed by symbols."""
+    if isinstance(prices_input, tuple) or isinstance(prices_input, list):
+        return dict(zip(ASSETS, map(float, prices_input)))
+    return {k.upper(): float(v) for k, v in prices_input.items()}
 
-    dfs = []
-    for rows in tables:
-        if not rows:
-            continue
-        header, data = rows[0], rows[1:]
-        if not header or not data:
-            continue
-        df_a = _df_from_table(rows)
 
-        dfs.append(df_a)
+def attach_usd_values(df_units: pd.DataFrame, prices_input):
+    """Units frame + USD Value, mNAV, Premium and TTMCR. For repeated repricing of the
+    same units keep the PricingBase (see dataset_store) instead of calling this."""
+    return PricingBase(df_units).price(price_map(prices_input))
 
-    if not dfs:
-        return pd.DataFrame(columns=["Year","Month","Crypto Asset","Holdings (Unit)","USD Value","Date"])
+# Function to get historic treasury data from master sheets
+def _fetch_historic_data():
+    ranges = [f"historic_{a.lower()}!A:Z" for a in ASSETS]  # e.g., historic_btc!A:Z
+    tables = _fetch_tables(ranges)  # one API call, pooled client
 
-    df = pd.concat(dfs, ignore_index=True)
-    df = df[["Year","Month","Crypto Asset","Holdings (Unit)","USD Value"]]
+    df = _frame_from_tables(tables, ["Year","Month","Crypto Asset","Holdings (Unit)","USD Value"])
+    if df.empty:
+        return pd.DataFrame(columns=["Year","Month","Crypto Asset","Holdings (Unit)","USD Value","Date"])
 
     df["Crypto Asset"] = df["Crypto Asset"].astype(str).str.upper()
     df["Year"]  = pd.to_numeric(df["Year"], errors="coerce")
     df["Month"] = pd.to_numeric(df["Month"], errors="coerce")
     df = df[df["Year"] > 2023].dropna(subset=["Year","Month"])
 
-    df["Holdings (Unit)"] = pd.to_numeric(
-        df["Holdings (Unit)"].astype(str)
-        .str.replace(".", "", regex=False)
-        .str.replace(",", ".", regex=False),
-        errors="coerce"
-    ).fillna(0.0)
-    df["USD Value"] = pd.to_numeric(df["USD Value"], errors="coerce").fillna(0.0)
+    df["Holdings (Unit)"] = _parse_col(df, "Holdings (Unit)", "eu", "historic").fillna(0.0)
+    df["USD Value"] = _parse_col(df, "USD Value", "plain", "historic").fillna(0.0)
 
     df["Date"] = pd.to_datetime(
         {"year": df["Year"].astype(int), "month": df["Month"].astype(int), "day": 1},
@@ -268,3 +286,10 @@ def load_historic_data():
     )
     df = df.dropna(subset=["Date"])
     return df
+
+
+@st.cache_data(ttl=900, show_spinner=False)
+def load_historic_data():
+    # sorted by Date, so time ranges are binary-search slices (see filters.historic_view)
+    df = _load_with_snapshot("historic", _fetch_historic_data)
+    return df.sort_values("Date", kind="stable", ignore_index=True)
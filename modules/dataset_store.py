@@ -0,0 +1,79 @@
+import hashlib
+import streamlit as st
+import pandas as pd
+from modules.data_loader import price_map, load_historic_data
+from modules.pricing import PricingBase
+from modules.snapshot_cache import frame_version
+
+
+# Process-wide datasets. Every session holds a reference to the same frame, so
+# frames returned from here are read-only: copy before adding or changing columns.
+
+_last_units = [None, None]   # (units frame, its content version): skip rehashing the same object
+
+
+def dataset_version(units_version: str, prices) -> str:
+    """Version stamp of a priced dataset = units snapshot + price tuple."""
+    p = hashlib.sha1(repr(tuple(float(x) for x in prices)).encode()).hexdigest()[:8]
+    return f"{units_version}-{p}"
+
+
+def units_version_of(version: str) -> str:
+    """Units part of a dataset version: price-independent artifacts are keyed by it."""
+    return version.rsplit("-", 1)[0]
+
+
+def _units_version(units_df: pd.DataFrame) -> str:
+    df, version = _last_units
+    if df is not units_df:
+        version = frame_version(units_df)
+        _last_units[:] = [units_df, version]
+    return version
+
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _pricing_base(units_version: str, _units_df: pd.DataFrame) -> PricingBase:
+    return PricingBase(_units_df)
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _priced_frame(version: str, _units_df: pd.DataFrame, _prices: tuple) -> pd.DataFrame:
+    # a new price tuple only reprices: the arrays of the units snapshot are reused
+    return _pricing_base(units_version_of(version), _units_df).price(price_map(_prices))
+
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _shared_frame(kind: str, version: str, _df: pd.DataFrame) -> pd.DataFrame:
+    return _df
+
+
+def get_dataset(units_df: pd.DataFrame, prices):
+    """Return (version, priced frame) for this units snapshot and price tuple.
+    The frame is built once per process and shared by all sessions."""
+    version = dataset_version(_units_version(units_df), prices)
+    return version, _priced_frame(version, units_df, tuple(prices))
+
+
+def is_shared_dataset(df: pd.DataFrame) -> bool:
+    """True if df is this session's shared priced dataset (st.session_state["data_df"])."""
+    return df is st.session_state.get("data_df") and "dataset_version" in st.session_state
+
+
+def get_historic(df: pd.DataFrame) -> pd.DataFrame:
+    """Shared instance of the historic frame (one per content version)."""
+    return _shared_frame("historic", frame_version(df), df)
+
+
+def current_historic() -> pd.DataFrame:
+    """Historic frame for this session, loaded on first use (Trends page) rather than at init."""
+    if "historic_df" not in st.session_state:
+        df = load_historic_data()
+        version = frame_version(df)
+        st.session_state["historic_version"] = version
+        st.session_state["historic_df"] = _shared_frame("historic", version, df)
+    return st.session_state["historic_df"]
+
+
+def is_shared_historic(df: pd.DataFrame) -> bool:
+    """True if df is this session's shared historic frame (st.session_state["historic_df"])."""
+    return df is st.session_state.get("historic_df") and "historic_version" in st.session_state
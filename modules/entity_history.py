@@ -0,0 +1,199 @@
+import os, hashlib, threading
+import numpy as np
+import pandas as pd
+import streamlit as st
+from modules.snapshot_cache import SNAPSHOT_DIR, frame_version
+
+
+# One folder per month (YYYY-MM), at most one Parquet file per day:
+# <epoch seconds>_<holdings version>.parquet. Files are immutable; a newer snapshot of
+# the same day replaces the earlier one, older days are never rewritten.
+HISTORY_DIR = os.path.join(SNAPSHOT_DIR, "entity_history")
+ROW_COLUMNS = ["Entity Name", "Crypto Asset", "Holdings (Unit)", "Market Cap"]
+KEY_COLUMNS = ["Entity Name", "Crypto Asset", "Holdings (Unit)"]   # what a new snapshot must change
+HISTORY_COLUMNS = ["Date"] + ROW_COLUMNS
+
+_lock = threading.RLock()   # one writer at a time (units refreshes run on background threads)
+_listing = None             # [(taken, version, path)] oldest first; scanned once, kept current by record_snapshot
+
+
+def month_start(when=None) -> pd.Timestamp:
+    return (pd.Timestamp.now() if when is None else pd.Timestamp(when)).normalize().replace(day=1)
+
+
+def snapshot_rows(units_df: pd.DataFrame) -> pd.DataFrame:
+    """One row per (entity, asset) with holdings, sorted by entity and asset.
+    Pairs without holdings are left out: absent pairs read as zero units."""
+    rows = (units_df.groupby(["Entity Name", "Crypto Asset"], observed=True, as_index=False)
+                    .agg(**{"Holdings (Unit)": ("Holdings (Unit)", "sum"),
+                            "Market Cap": ("Market Cap", "max")}))
+    rows = rows[rows["Holdings (Unit)"] > 0]
+    rows["Entity Name"] = rows["Entity Name"].astype(str)
+    rows["Crypto Asset"] = rows["Crypto Asset"].astype(str)
+    return rows.sort_values(["Entity Name", "Crypto Asset"]).reset_index(drop=True)[ROW_COLUMNS]
+
+
+def _scan() -> list[tuple[pd.Timestamp, str, str]]:
+    out = []
+    if not os.path.isdir(HISTORY_DIR):
+        return out
+    for month in os.scandir(HISTORY_DIR):
+        if not month.is_dir():
+            continue
+        for f in os.scandir(month.path):
+            stem, ext = os.path.splitext(f.name)
+            if ext != ".parquet" or "_" not in stem:
+                continue
+            ts, version = stem.split("_", 1)
+            out.append((pd.Timestamp(int(ts), unit="s"), version, f.path))
+    return sorted(out)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError as e:
+        print(f"entity history prune failed: {e}")
+
+
+def _compact(files: list) -> list:
+    """Keep the latest snapshot of each day, delete the others."""
+    keep = {}
+    for entry in files:
+        keep[entry[0].normalize()] = entry   # oldest first: the last one of a day wins
+    for entry in files:
+        if keep[entry[0].normalize()] is not entry:
+            _remove(entry[2])
+    return sorted(keep.values())
+
+
+def _snapshot_files() -> list[tuple[pd.Timestamp, str, str]]:
+    """(taken, version, path) of every stored snapshot, oldest first. The folder is
+    scanned (and compacted to one snapshot per day) once per process."""
+    global _listing
+    with _lock:
+        if _listing is None:
+            _listing = _compact(_scan())
+        return list(_listing)
+
+
+def record_snapshot(units_df: pd.DataFrame, when=None) -> bool:
+    """Store units_df unless its holdings equal the latest stored snapshot (Market Cap
+    moves with every refresh and is not compared). A snapshot taken on the same day as
+    the latest one replaces it. Returns True if a snapshot was written."""
+    global _listing
+    rows = snapshot_rows(units_df)
+    if rows.empty:
+        return False
+    version = frame_version(rows[KEY_COLUMNS])
+    taken = pd.Timestamp.now() if when is None else pd.Timestamp(when)
+    with _lock:
+        files = _snapshot_files()
+        if files and files[-1][1] == version:
+            return False
+        folder = os.path.join(HISTORY_DIR, taken.strftime("%Y-%m"))
+        path = os.path.join(folder, f"{int(taken.timestamp())}_{version}.parquet")
+        try:
+            os.makedirs(folder, exist_ok=True)
+            rows.to_parquet(path + ".tmp", index=False)   # readers never see a half-written file
+            os.replace(path + ".tmp", path)
+        except Exception as e:
+            print(f"entity history append failed: {e}")
+            return False
+        same_day = [f for f in files if f[0].normalize() == taken.normalize() and f[2] != path]
+        for f in same_day:
+            _remove(f[2])
+        _listing = sorted([f for f in files if f not in same_day] + [(taken.floor("s"), version, path)])
+        return True
+
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def _read_snapshot(path: str) -> pd.DataFrame:
+    # files are immutable (the name carries the content version), so a path is a stable key
+    return pd.read_parquet(path)
+
+
+class EntityHistory:
+    """Stored snapshots, read lazily: a snapshot (or the month-end snapshots) reads only
+    its own files. entity() builds, on first use, one columnar frame sorted by
+    (entity, snapshot) with row offsets per entity, so an entity's time series is a
+    single slice found in O(1) without scanning the history."""
+
+    def __init__(self, files: list[tuple[pd.Timestamp, str, str]], version: str | None):
+        self.version = version
+        self.taken = pd.DatetimeIndex([t for t, _, _ in files], name="Taken")
+        self._paths = [p for _, _, p in files]
+        self._rows = None
+        self._monthly = None
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def _index(self):
+        if self._rows is None:
+            frames = [self.snapshot(i) for i in range(len(self))]
+            df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=ROW_COLUMNS + ["Snapshot"])
+            codes, names = pd.factorize(df["Entity Name"], sort=True)
+            order = np.lexsort((df["Snapshot"].to_numpy(dtype=np.int64), codes))
+            self._entities = pd.Index(names, name="Entity Name")
+            self._entity_offsets = np.searchsorted(codes[order], np.arange(len(names) + 1))
+            self._rows = df.take(order).reset_index(drop=True)
+        return self._rows
+
+    @property
+    def rows(self) -> pd.DataFrame:
+        """Every stored row, sorted by (entity, snapshot)."""
+        return self._index()
+
+    @property
+    def entities(self) -> pd.Index:
+        self._index()
+        return self._entities
+
+    def entity(self, name: str) -> pd.DataFrame:
+        """Every stored row of one entity, oldest snapshot first, with its Taken time."""
+        rows = self._index()
+        if name not in self._entities:
+            return rows.iloc[0:0].assign(Taken=pd.Series(dtype="datetime64[ns]"))
+        i = self._entities.get_loc(name)
+        rows = rows.iloc[self._entity_offsets[i]:self._entity_offsets[i + 1]]
+        return rows.assign(Taken=self.taken[rows["Snapshot"].to_numpy()])
+
+    def entity_series(self, name: str, value: str = "Holdings (Unit)") -> pd.DataFrame:
+        """Taken x asset matrix of one entity (0 where an asset was not held)."""
+        rows = self.entity(name)
+        return rows.pivot_table(index="Taken", columns="Crypto Asset", values=value, aggfunc="sum", fill_value=0.0)
+
+    def snapshot(self, i: int) -> pd.DataFrame:
+        return _read_snapshot(self._paths[i])[ROW_COLUMNS].assign(Snapshot=i)
+
+    def at(self, when) -> pd.DataFrame:
+        """Rows of the latest snapshot taken at or before `when` (empty before the first)."""
+        i = self.taken.searchsorted(pd.Timestamp(when), side="right") - 1
+        return self.snapshot(i) if i >= 0 else pd.DataFrame(columns=ROW_COLUMNS + ["Snapshot"])
+
+    def monthly(self) -> pd.DataFrame:
+        """Latest snapshot of each month, stamped with the month start (Date), as
+        used by the entity flow decomposition. Reads only those snapshots."""
+        if self._monthly is None:
+            months = self.taken.to_period("M")
+            last = np.flatnonzero(np.r_[months[1:] != months[:-1], True]) if len(months) else np.array([], dtype=int)
+            parts = [self.snapshot(i).assign(Date=month_start(self.taken[i])) for i in last]
+            self._monthly = (pd.concat(parts, ignore_index=True)[HISTORY_COLUMNS] if parts
+                             else pd.DataFrame(columns=HISTORY_COLUMNS))
+        return self._monthly
+
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _load_history(version: str, _files: tuple) -> EntityHistory:
+    return EntityHistory(list(_files), version)
+
+
+def load_entity_history() -> EntityHistory:
+    """The stored entity history, shared read-only by all sessions and rebuilt only when
+    a snapshot was stored (version = hash of the snapshot list; None while empty)."""
+    files = _snapshot_files()
+    if not files:
+        return EntityHistory([], None)
+    version = hashlib.sha1("|".join(os.path.basename(p) for _, _, p in files).encode()).hexdigest()[:16]
+    return _load_history(version, tuple(files))
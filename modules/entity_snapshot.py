@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+from modules.view_cache import derived
+
+
+SNAPSHOT_COLUMNS = ["Entity Name", "Entity Type", "Country", "MarketCap", "CryptoNAV",
+                    "Core Proxy", "Exposure %", "Premium %", "mNAV"]
+
+
+def group_mode(df: pd.DataFrame, key: str, col: str) -> pd.Series:
+    """Most frequent non-null col per key; ties go to the smallest value (as Series.mode().iat[0]).
+    One count per (key, value) pair, then sort-and-take instead of a mode per group."""
+    counts = df.groupby([key, col], observed=True).size().rename("n").reset_index()
+    counts = counts.sort_values([key, "n", col], ascending=[True, False, True], kind="stable")
+    return counts.drop_duplicates(key).set_index(key)[col]
+
+
+def build_entity_snapshot(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per entity with:
+      - MarketCap  (max of 'Market Cap')
+      - CryptoNAV  (sum of USD Value across assets)
+      - Exposure % (CryptoNAV / MarketCap)
+      - Premium %  (first 'Premium' value, else (MarketCap - mNAV)/mNAV from the first 'mNAV' value)
+      - mNAV       (MarketCap / CryptoNAV)
+      - Entity Type, Country (mode)
+    """
+    g = df.groupby("Entity Name", observed=True)
+    snap = g.agg(**{"CryptoNAV": ("USD Value", "sum"), "MarketCap": ("Market Cap", "max")})
+    # first non-null value per entity in row order
+    first = g[[c for c in ("mNAV", "Premium") if c in df.columns]].first()
+    mnav_col = first["mNAV"] if "mNAV" in first else pd.Series(np.nan, index=snap.index)
+    prem = first["Premium"] if "Premium" in first else pd.Series(np.nan, index=snap.index)
+
+    snap["Entity Type"] = group_mode(df, "Entity Name", "Entity Type").reindex(snap.index)
+    snap["Country"] = group_mode(df, "Entity Name", "Country").reindex(snap.index)
+
+    mcap, nav = snap["MarketCap"].to_numpy(dtype=float), snap["CryptoNAV"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        snap["Exposure %"] = np.where(mcap > 0, nav / mcap * 100.0, np.nan)
+        if prem.isna().all():
+            prem = (snap["MarketCap"] - mnav_col) / mnav_col * 100.0
+        snap["mNAV"] = np.where(nav > 0, mcap / nav, np.nan)
+    snap["Premium %"] = prem
+
+    # Core proxy (for decomposition)
+    snap["Core Proxy"] = np.maximum(mcap - nav, 0.0)
+
+    return snap.reset_index()[SNAPSHOT_COLUMNS]
+
+
+def get_entity_snapshot(df: pd.DataFrame) -> pd.DataFrame:
+    """Entity snapshot of df, built once per cached view (read-only: copy before changing)."""
+    return derived(df, "entity_snapshot", build_entity_snapshot)
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+from modules.view_cache import cached_view
+from modules.dataset_store import units_version_of, is_shared_dataset
+
+
+# Filter dimensions of the priced units frame
+INDEXED_COLUMNS = ["Crypto Asset", "Entity Type", "Country"]
+
+
+def dimension_masks(df: pd.DataFrame) -> dict:
+    """{column: {value: boolean row mask}}; depends only on the units, not on prices."""
+    masks = {}
+    for col in INDEXED_COLUMNS:
+        codes, uniques = pd.factorize(df[col])   # categorical codes, or hashed once for object columns
+        masks[col] = {v: codes == i for i, v in enumerate(uniques)}
+    return masks
+
+
+class FilterIndex:
+    """Row masks per distinct value of each filter dimension plus a positive-USD mask.
+    Any filter combination is then a few boolean ANDs and one take, no matter how
+    many dimensions are filtered on."""
+
+    def __init__(self, df: pd.DataFrame, masks: dict | None = None):
+        self.n = len(df)
+        self.masks = dimension_masks(df) if masks is None else masks
+        self.positive = (df["USD Value"] > 0).to_numpy()
+        self._none = np.zeros(self.n, dtype=bool)
+
+    def mask(self, assets=None, entity_type="All", country="All", positive=True) -> np.ndarray:
+        """assets=None means no asset filter; "All" disables the type/country filter."""
+        m = self.positive.copy() if positive else np.ones(self.n, dtype=bool)
+        if assets is not None:
+            by_asset = self.masks["Crypto Asset"]
+            m &= np.logical_or.reduce([by_asset.get(a, self._none) for a in assets] or [self._none])
+        if entity_type != "All":
+            m &= self.masks["Entity Type"].get(entity_type, self._none)
+        if country != "All":
+            m &= self.masks["Country"].get(country, self._none)
+        return m
+
+    def select(self, df: pd.DataFrame, **filters) -> pd.DataFrame:
+        return df.take(np.flatnonzero(self.mask(**filters)))
+
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _shared_masks(units_version: str, _df: pd.DataFrame) -> dict:
+    return dimension_masks(_df)
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _shared_index(version: str, _df: pd.DataFrame) -> FilterIndex:
+    # only the positive-USD mask is rebuilt on a price change
+    return FilterIndex(_df, masks=_shared_masks(units_version_of(version), _df))
+
+
+def get_filter_index(df: pd.DataFrame) -> FilterIndex:
+    """Index for df; built once per dataset version when df is the session's shared dataset."""
+    if is_shared_dataset(df):
+        return _shared_index(st.session_state["dataset_version"], df)
+    return FilterIndex(df)
+
+
+def filtered_view(df: pd.DataFrame, assets, entity_type="All", country="All", positive=True) -> pd.DataFrame:
+    """Rows of df matching the filters (and with positive USD value unless positive=False).
+    Views of the shared dataset are memoized across sessions, keyed by
+    (dataset_version, assets, entity_type, country[, positive])."""
+    filters = dict(assets=assets, entity_type=entity_type, country=country, positive=positive)
+    if not is_shared_dataset(df):
+        return FilterIndex(df).select(df, **filters)
+    version = st.session_state["dataset_version"]
+    key = (version, None if assets is None else tuple(sorted(assets)), entity_type, country)
+    if not positive:
+        key += ("incl_zero",)
+    return cached_view(key, lambda: _shared_index(version, df).select(df, **filters))
@@ -1,5 +1,9 @@
 import streamlit as st
 import pandas as pd
+from modules.filter_index import filtered_view
+from modules.view_cache import cached_view
+from modules.dataset_store import is_shared_historic
+from modules.history_matrix import historic_matrix, time_window
 
 
 def _opts(series):
@@ -74,13 +78,7 @@ def apply_filters(df):
             st.info("Select at least one Crypto Asset to display data")
             return df.iloc[0:0]
 
-        out = df[df["Crypto Asset"].isin(sel_assets)]
-        if sel_et != "All":
-            out = out[out["Entity Type"] == sel_et]
-        if sel_co != "All":
-            out = out[out["Country"] == sel_co]
-        out = out[out["USD Value"] > 0]
-        return out
+        return filtered_view(df, sel_assets, sel_et, sel_co)
 
 
 
@@ -114,18 +112,44 @@ def apply_filters_historic(df: pd.DataFrame):
         )
         st.session_state["flt_time_range"] = sel_tr
 
-        # --- Filtering logic (unchanged)
-        df_filtered = df[df["Crypto Asset"].isin(sel_assets)] if sel_assets else df.iloc[0:0]
-
-        if not df_filtered.empty and sel_tr != "All":
-            latest_date = df_filtered["Date"].max()
-            if sel_tr == "3M":
-                cutoff_date = latest_date - pd.DateOffset(months=3)
-            elif sel_tr == "12M":
-                cutoff_date = latest_date - pd.DateOffset(months=12)
-            elif sel_tr == "YTD":
-                cutoff_date = pd.Timestamp(year=latest_date.year - 1, month=12, day=31)
-            df_filtered = df_filtered[df_filtered["Date"] >= cutoff_date]
-
-        df_filtered = df_filtered[df_filtered["USD Value"] > 0]
-        return df_filtered
+        return historic_view(df, sel_assets, sel_tr)
+
+
+def _filter_historic(df: pd.DataFrame, assets, time_range) -> pd.DataFrame:
+    df_filtered = df[df["Crypto Asset"].isin(assets)] if assets else df.iloc[0:0]
+
+    if not df_filtered.empty and time_range != "All":
+        start, end = time_window(df_filtered["Date"].max(), time_range)
+        if start is not None:
+            df_filtered = df_filtered[df_filtered["Date"] >= start]
+        if end is not None:
+            df_filtered = df_filtered[df_filtered["Date"] <= end]
+
+    return df_filtered[df_filtered["USD Value"] > 0]
+
+
+def _slice_historic(df: pd.DataFrame, assets, time_range) -> pd.DataFrame:
+    """_filter_historic for the shared historic frame, which the loader sorts by Date:
+    the latest date of the selection comes from the full history matrix and the time
+    window is cut out of the frame by binary search before the asset mask is applied."""
+    if not assets:
+        return df.iloc[0:0]
+    m = historic_matrix().select(assets)
+    if m.empty:
+        return df.iloc[0:0]
+    start, end = time_window(m.usd.index[-1], time_range)
+    lo = df["Date"].searchsorted(start, side="left") if start is not None else 0
+    hi = df["Date"].searchsorted(end, side="right") if end is not None else len(df)
+    rows = df.iloc[lo:hi]
+    return rows[rows["Crypto Asset"].isin(assets) & (rows["USD Value"] > 0)]
+
+
+def historic_view(df: pd.DataFrame, assets, time_range="All") -> pd.DataFrame:
+    """Historic rows for the selected assets and time range (with positive USD value).
+    time_range is "All", "3M", "YTD", "12M" or a custom (start, end) pair of dates.
+    Views of the shared historic frame are memoized across sessions, so artifacts
+    derived from them (e.g. the flow decomposition) are computed once per filter."""
+    if not is_shared_historic(df):
+        return _filter_historic(df, assets, time_range)
+    key = ("historic", st.session_state["historic_version"], tuple(sorted(assets or ())), time_range)
+    return cached_view(key, lambda: _slice_historic(df, assets, time_range))
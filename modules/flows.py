@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+from modules.parsing import parse_numbers
+from modules.view_cache import derived
+
+
+# ΔUSD = price_effect + units_effect per row; CUMULATIVE_COLUMNS are their running sums per series
+FLOW_COLUMNS = ["d_usd", "price_effect", "units_effect"]
+CUMULATIVE_COLUMNS = ["cum_" + c for c in FLOW_COLUMNS]
+
+
+def prep_history(hist: pd.DataFrame, keys=("Crypto Asset",)) -> pd.DataFrame:
+    """Normalize columns, ensure numerics, derive Price USD if missing, ffill/bfill per series.
+    Rows come back sorted by keys + Date."""
+    keys = list(keys)
+    h = hist.copy()
+    if "Date" not in h.columns:
+        if "date" in h.columns:
+            h["Date"] = pd.to_datetime(h["date"])
+        else:
+            h["Date"] = pd.to_datetime(dict(year=h["Year"], month=h["Month"], day=1), errors="coerce")
+
+    h = h.rename(columns=lambda c: str(c).strip())
+    alias = {
+        "Price": "Price USD", "Price_USD": "Price USD",
+        "USD": "USD Value",   "USD_Value": "USD Value",
+        "Holdings": "Holdings (Unit)", "Units": "Holdings (Unit)",
+    }
+    for k, v in alias.items():
+        if k in h.columns and v not in h.columns:
+            h.rename(columns={k: v}, inplace=True)
+
+    for col in ["Holdings (Unit)", "USD Value", "Price USD"]:
+        if col not in h.columns:
+            h[col] = np.nan
+
+    h["Holdings (Unit)"] = parse_numbers(h["Holdings (Unit)"])
+    h["USD Value"]       = parse_numbers(h["USD Value"])
+    h["Price USD"]       = parse_numbers(h["Price USD"])
+
+    need_p = h["Price USD"].isna()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        implied = h["USD Value"] / h["Holdings (Unit)"]
+    h.loc[need_p, "Price USD"] = implied[need_p]
+
+    need_usd = h["USD Value"].isna() & h["Price USD"].notna() & h["Holdings (Unit)"].notna()
+    h.loc[need_usd, "USD Value"] = h.loc[need_usd, "Price USD"] * h.loc[need_usd, "Holdings (Unit)"]
+
+    h = h.sort_values(keys + ["Date"], kind="stable").reset_index(drop=True)
+    # grouped ffill, then grouped bfill (= s.ffill().bfill() per series, without a lambda per group)
+    by = [h[k] for k in keys]
+    price = h["Price USD"].groupby(by, sort=False, observed=True).ffill()
+    h["Price USD"] = price.groupby(by, sort=False, observed=True).bfill()
+    return h
+
+
+def decompose(h: pd.DataFrame, keys=("Crypto Asset",)) -> pd.DataFrame:
+    """Exact ΔUSD decomposition per series (keys), for all series at once:
+       ΔUSD = units_prev * Δprice  +  price_curr * Δunits
+    Expects prep_history output (sorted by keys + Date). The first month of each series
+    has no delta and is dropped; cum_* columns accumulate the flows from there on."""
+    keys = list(keys)
+    g = h.groupby(keys, sort=False, observed=True)
+    units_prev = g["Holdings (Unit)"].shift()
+    price_prev = g["Price USD"].shift()
+    out = h.assign(
+        units_prev=units_prev,
+        price_prev=price_prev,
+        d_usd=g["USD Value"].diff(),
+        price_effect=(h["Price USD"] - price_prev) * units_prev,
+        units_effect=(h["Holdings (Unit)"] - units_prev) * h["Price USD"],
+    )
+    out = out.dropna(subset=FLOW_COLUMNS)
+    cum = out.groupby(keys, sort=False, observed=True)[FLOW_COLUMNS].cumsum()
+    out[CUMULATIVE_COLUMNS] = cum.to_numpy()
+    return out
+
+
+def flows_by_date(decomp: pd.DataFrame) -> pd.DataFrame:
+    """Flows summed over all series per Date, with cumulative attribution over the window."""
+    out = decomp.groupby("Date")[FLOW_COLUMNS].sum()
+    out[CUMULATIVE_COLUMNS] = out[FLOW_COLUMNS].cumsum().to_numpy()
+    return out.reset_index()
+
+
+def asset_flows(df_hist: pd.DataFrame) -> pd.DataFrame:
+    """Per-asset decomposition of a historic view, computed once per cached view (filter)."""
+    return derived(df_hist, "flows:asset", lambda d: decompose(prep_history(d)))
+
+
+def total_flows(df_hist: pd.DataFrame) -> pd.DataFrame:
+    """flows_by_date of asset_flows, computed once per cached view (filter)."""
+    return derived(df_hist, "flows:total", lambda d: flows_by_date(asset_flows(d)))
+
+
+# ---- entity level ----
+
+def implied_prices(historic_df: pd.DataFrame) -> pd.DataFrame:
+    """Date x asset price implied by the historic sheet (USD Value / units); NaN without units."""
+    h = historic_df[historic_df["Holdings (Unit)"] > 0]
+    g = h.groupby(["Date", "Crypto Asset"], observed=True)[["USD Value", "Holdings (Unit)"]].sum()
+    px = (g["USD Value"] / g["Holdings (Unit)"]).unstack("Crypto Asset").sort_index()
+    return px.where(px > 0)
+
+
+def monthly_prices(historic_df: pd.DataFrame, live_prices: dict, live_month: pd.Timestamp) -> pd.DataFrame:
+    """Month x asset prices: implied by the historic sheet, live prices for live_month."""
+    live = pd.DataFrame([live_prices], index=pd.DatetimeIndex([live_month]))
+    return live.combine_first(implied_prices(historic_df)).sort_index()
+
+
+def entity_flows(history: pd.DataFrame, prices: pd.DataFrame) -> pd.DataFrame:
+    """The same ΔUSD = units_prev·Δprice + price·Δunits split per entity and month,
+    for the whole universe in one batched pass.
+
+    history: entity snapshots (Date, Entity Name, Crypto Asset, Holdings (Unit)); a pair
+    missing from a month holds zero units. prices: month x asset (see monthly_prices),
+    carried forward/back to months without a price.
+    Holdings go into a dense (entity, asset) x month matrix; the effects are column
+    differences of that matrix, summed per entity with one scatter-add."""
+    months = pd.DatetimeIndex(sorted(history["Date"].unique()))
+    if len(months) < 2:
+        return pd.DataFrame(columns=["Entity Name", "Date"] + FLOW_COLUMNS)
+
+    ec, entities = pd.factorize(history["Entity Name"], sort=True)
+    ac, assets = pd.factorize(history["Crypto Asset"], sort=True)
+    pc, pairs = pd.factorize(ec * len(assets) + ac)
+    units = np.zeros((len(pairs), len(months)))
+    np.add.at(units, (pc, months.get_indexer(history["Date"])), history["Holdings (Unit)"].to_numpy(dtype=float))
+
+    px = prices.reindex(columns=assets)
+    px = px.reindex(px.index.union(months)).ffill().bfill().reindex(months).fillna(0.0)
+    price = px.to_numpy(dtype=float).T[pairs % len(assets)]    # pair x month
+
+    effects = {
+        "d_usd": units[:, 1:] * price[:, 1:] - units[:, :-1] * price[:, :-1],
+        "price_effect": (price[:, 1:] - price[:, :-1]) * units[:, :-1],
+        "units_effect": (units[:, 1:] - units[:, :-1]) * price[:, 1:],
+    }
+    owner = pairs // len(assets)
+    out = {}
+    for col, x in effects.items():
+        per_entity = np.zeros((len(entities), x.shape[1]))
+        np.add.at(per_entity, owner, x)
+        out[col] = per_entity.ravel()
+
+    return pd.DataFrame({
+        "Entity Name": np.repeat(np.asarray(entities, dtype=object), len(months) - 1),
+        "Date": np.tile(months[1:], len(entities)),
+        **out,
+    })
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _entity_flows(key: tuple, _history: pd.DataFrame, _historic_df: pd.DataFrame, _live_prices: dict) -> pd.DataFrame:
+    if _history.empty:
+        return entity_flows(_history, pd.DataFrame())
+    return entity_flows(_history, monthly_prices(_historic_df, _live_prices, _history["Date"].max()))
+
+
+def get_entity_flows(history_version: str, history: pd.DataFrame, historic_df: pd.DataFrame,
+                     live_prices: dict, assets=None) -> pd.DataFrame:
+    """entity_flows over the selected assets (all when None), computed once per
+    (history version, historic version, live prices, assets) and shared by all sessions."""
+    key = (history_version, st.session_state.get("historic_version"),
+           tuple(sorted(live_prices.items())), None if assets is None else tuple(sorted(assets)))
+    if assets is not None:
+        history = history[history["Crypto Asset"].isin(assets)]
+    return _entity_flows(key, history, historic_df, live_prices)
+
+
+def flow_leaderboard(flows: pd.DataFrame, n: int = 10, date=None):
+    """(top accumulators, top sellers) of one month (default: the latest), ranked by
+    the units effect, i.e. USD bought or sold at that month's price."""
+    if flows.empty:
+        return flows, flows
+    date = flows["Date"].max() if date is None else pd.Timestamp(date)
+    month = flows[flows["Date"] == date]
+    buyers = month[month["units_effect"] > 0].nlargest(n, "units_effect")
+    sellers = month[month["units_effect"] < 0].nsmallest(n, "units_effect")
+    return buyers, sellers
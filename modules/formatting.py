@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+from modules.dataset_store import is_shared_dataset
+
+
+# (threshold, suffix) from largest to smallest
+_USD_STEPS = [(1e12, "T"), (1e9, "B"), (1e6, "M"), (1e3, "K")]
+
+
+def usd_labels(values, decimals: int = 1, na: str = "-") -> np.ndarray:
+    """USD with magnitude suffix for a whole array: $1.2T / $3.4B / $5.6M / $7.8K / $950.
+    Charts use 1 decimal, tables and the PDF export 2; NaN/None become `na`."""
+    v = np.asarray(values, dtype=float)   # None -> NaN
+    div = np.ones_like(v)
+    suffix = np.full(v.shape, "", dtype=object)
+    for step, s in reversed(_USD_STEPS):    # largest matching threshold wins
+        hit = np.abs(v) >= step
+        div[hit] = step
+        suffix[hit] = s
+    small = np.char.mod("%.0f", v).astype(object)   # object: fixed-width str would truncate "1,000"
+    small[small == "1000"] = "1,000"                 # only 999.5..999.99 reach 4 digits
+    small[small == "-1000"] = "-1,000"
+    num = np.where(div == 1, small, np.char.mod(f"%.{decimals}f", v / div))
+    out = "$" + num.astype(object) + suffix
+    out[np.isnan(v)] = na
+    return out
+
+
+def format_usd(value, decimals: int = 1, na: str = "-") -> str:
+    """Scalar form of usd_labels."""
+    return usd_labels([value], decimals, na)[0]
+
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def _dataset_usd_column(version: str, col: str, decimals: int, _values: pd.Series) -> pd.Series:
+    return pd.Series(usd_labels(_values, decimals), index=_values.index, name=col)
+
+
+def usd_column(df: pd.DataFrame, col: str, decimals: int = 2) -> pd.Series:
+    """usd_labels of df[col] aligned to df; computed once per dataset version for the shared dataset."""
+    if is_shared_dataset(df):
+        return _dataset_usd_column(st.session_state["dataset_version"], col, decimals, df[col])
+    return pd.Series(usd_labels(df[col], decimals), index=df.index, name=col)
+
+
+def int_labels(values, sep: str = ",") -> np.ndarray:
+    """f"{int(x):,}" for a whole array."""
+    out = np.array([f"{x:,}" for x in np.trunc(np.asarray(values, dtype=float)).astype(np.int64).tolist()], dtype=object)
+    return out if sep == "," else np.array([s.replace(",", sep) for s in out], dtype=object)
+
+
+def join_lines(keys, lines, sep: str = "<br>") -> pd.Series:
+    """sep-joined lines per key (a Series, or a list of Series for composite keys).
+    Lines are joined in row order, so sort the rows first to control the order."""
+    index = keys[0].index if isinstance(keys, list) else keys.index
+    return (pd.Series(np.asarray(lines, dtype=object), index=index)
+              .groupby(keys, sort=False, observed=True)
+              .agg(sep.join))
+
+
+def hover_blocks(keys: pd.Series, lines, title=None, footer: pd.Series | None = None) -> pd.Series:
+    """One hover block per key: "<b>title</b><br>line<br>line..." (+ "<br>footer"), see join_lines.
+    title(index) maps the group keys to their titles (default: the key itself);
+    footer is indexed by key."""
+    joined = join_lines(keys, lines)
+    idx = joined.index
+    head = (idx.astype(str) if title is None else pd.Index(title(idx)).astype(str)).to_numpy(dtype=object)
+    out = "<b>" + head + "</b><br>" + joined.to_numpy(dtype=object)
+    if footer is not None:
+        out = out + "<br>" + footer.reindex(idx).to_numpy(dtype=object)
+    return pd.Series(out, index=idx)
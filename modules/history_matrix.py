@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+from modules.view_cache import derived, derived_keyed
+from modules.dataset_store import is_shared_dataset, current_historic
+
+
+class HistoryMatrix:
+    """Date x asset totals of a historic frame: USD Value and units as two aligned frames
+    on a sorted DatetimeIndex, assets sorted by name. NaN marks months in which an asset
+    has no row (a month with rows but no value is 0)."""
+
+    def __init__(self, usd: pd.DataFrame, units: pd.DataFrame, live: bool = False):
+        self.usd = usd
+        self.units = units
+        self.live = live   # True if the last row is the live snapshot
+
+    @classmethod
+    def from_long(cls, df: pd.DataFrame) -> "HistoryMatrix":
+        d = pd.DataFrame({
+            "Date": df["Date"],
+            "Crypto Asset": df["Crypto Asset"].astype(str).str.upper(),
+            "USD Value": pd.to_numeric(df["USD Value"], errors="coerce").fillna(0.0),
+            "Holdings (Unit)": pd.to_numeric(df.get("Holdings (Unit)"), errors="coerce").fillna(0.0),
+        })
+        g = d.groupby(["Date", "Crypto Asset"]).sum()
+        return cls(g["USD Value"].unstack("Crypto Asset"), g["Holdings (Unit)"].unstack("Crypto Asset"))
+
+    @property
+    def empty(self) -> bool:
+        return self.usd.empty
+
+    def select(self, assets) -> "HistoryMatrix":
+        """Columns of the given assets, restricted to the dates on which any of them has a row."""
+        cols = self.usd.columns.intersection(pd.Index(list(assets)), sort=False)
+        usd = self.usd[cols]
+        keep = usd.notna().any(axis=1).to_numpy()
+        return HistoryMatrix(usd[keep], self.units[cols][keep], self.live)
+
+    def window(self, start=None, end=None) -> "HistoryMatrix":
+        """Rows dated start..end (inclusive; None = open), cut by binary search on the date index."""
+        dates = self.usd.index
+        lo = dates.searchsorted(pd.Timestamp(start), side="left") if start is not None else 0
+        hi = dates.searchsorted(pd.Timestamp(end), side="right") if end is not None else len(dates)
+        return HistoryMatrix(self.usd.iloc[lo:hi], self.units.iloc[lo:hi], self.live and hi == len(dates))
+
+    def with_live(self, current_df: pd.DataFrame) -> "HistoryMatrix":
+        """Copy with the live snapshot (current_df summed per asset) appended as the month
+        after the last stored one; only assets already in the matrix are kept."""
+        last = self.usd.index.max() if not self.empty else pd.Timestamp.today().normalize()
+        date = pd.Timestamp(last).normalize() + pd.offsets.MonthBegin(1)
+        asset = current_df["Crypto Asset"].astype(str).str.upper()
+        snap = pd.DataFrame({
+            "USD Value": pd.to_numeric(current_df["USD Value"], errors="coerce").fillna(0.0).to_numpy(),
+            "Holdings (Unit)": pd.to_numeric(current_df.get("Holdings (Unit)"), errors="coerce").fillna(0.0).to_numpy(),
+        }, index=asset.to_numpy()).groupby(level=0).sum()
+        snap = snap.reindex(self.usd.columns)
+        usd = pd.concat([self.usd, snap["USD Value"].to_frame(date).T])
+        units = pd.concat([self.units, snap["Holdings (Unit)"].to_frame(date).T])
+        usd.index.name = units.index.name = "Date"
+        return HistoryMatrix(usd, units, live=True)
+
+    def long(self) -> pd.DataFrame:
+        """Present (date, asset) cells as rows, ordered by date then asset."""
+        present = self.usd.notna().to_numpy()
+        rows, cols = np.nonzero(present)
+        return pd.DataFrame({
+            "Date": self.usd.index[rows],
+            "Crypto Asset": self.usd.columns[cols].astype(str),
+            "USD Value": self.usd.to_numpy()[rows, cols],
+            "Holdings (Unit)": self.units.to_numpy()[rows, cols],
+        })
+
+
+def time_window(latest: pd.Timestamp, time_range) -> tuple:
+    """(start, end) of a time range ending at latest: "All", "3M", "12M", "YTD" (since the
+    prior year-end) or a custom (start, end) pair. None leaves that side open."""
+    if isinstance(time_range, tuple):
+        start, end = time_range
+        return (None if start is None else pd.Timestamp(start),
+                None if end is None else pd.Timestamp(end))
+    if time_range == "3M":
+        return latest - pd.DateOffset(months=3), None
+    if time_range == "12M":
+        return latest - pd.DateOffset(months=12), None
+    if time_range == "YTD":
+        return pd.Timestamp(year=latest.year - 1, month=12, day=31), None
+    return None, None
+
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _historic_matrix(version: str, _df: pd.DataFrame) -> HistoryMatrix:
+    return HistoryMatrix.from_long(_df)
+
+
+def historic_matrix() -> HistoryMatrix:
+    """HistoryMatrix of the full historic frame (current_historic), built once per
+    historic version and shared read-only by all sessions."""
+    df = current_historic()
+    return _historic_matrix(st.session_state["historic_version"], df)
+
+
+def history_matrix(df_hist: pd.DataFrame) -> HistoryMatrix:
+    """HistoryMatrix of a historic view, built once per cached view (filter)."""
+    return derived(df_hist, "history_matrix", HistoryMatrix.from_long)
+
+
+def history_with_live(df_hist: pd.DataFrame, current_df: pd.DataFrame | None) -> HistoryMatrix:
+    """history_matrix with the live snapshot appended; shared by the historic charts and
+    built once per historic view and priced dataset (one live entry per view, replaced
+    when the dataset version changes)."""
+    if current_df is None or current_df.empty:
+        return history_matrix(df_hist)
+    if not is_shared_dataset(current_df):
+        return history_matrix(df_hist).with_live(current_df)
+    return derived_keyed(df_hist, "history_matrix:live", st.session_state["dataset_version"],
+                         lambda d: history_matrix(d).with_live(current_df))
@@ -6,6 +6,12 @@ from plotly.subplots import make_subplots
 import os, base64
 from modules.charts import render_rankings
 from modules.ui import render_plotly
+from modules.dataset_store import current_historic
+from modules.formatting import format_usd, usd_labels
+from modules.history_matrix import history_matrix, historic_matrix
+from modules.flows import asset_flows, total_flows, get_entity_flows, flow_leaderboard
+from modules.entity_history import load_entity_history
+from modules.data_loader import price_map
 
 
 COLORS = {"BTC":"#f7931a","ETH":"#6F6F6F","XRP":"#00a5df","BNB":"#f0b90b","SOL":"#dc1fff", "SUI":"#C0E6FF", "LTC":"#345D9D", "HYPE":"#97fce4", "Other": "rgba(255,255,255,0.9)"}
@@ -333,33 +339,40 @@ def top_5_holders(df, asset="BTC", key_prefix="top5"):
         )
 
 # Historic KPIs
-def _latest_and_prev_dates(dates: pd.Series):
-    """Return (latest_date, previous_available_date) from a series of pd.Timestamp."""
-    uniq = sorted(dates.dropna().unique())
-    if not uniq:
-        return None, None
-    if len(uniq) == 1:
-        return uniq[-1], None
-    return uniq[-1], uniq[-2]
-
-def _year_end_total(df: pd.DataFrame, year: int, value_col: str):
-    """Total at year-end (December of `year`) if present, else None."""
-    if df.empty:
-        return None
-    ydf = df[(df["Year"] == year) & (df["Month"] == 12)]
-    if ydf.empty:
-        return None
-    return float(ydf[value_col].sum())
+def _kpi_series(m, single_asset=None) -> pd.DataFrame:
+    """Date x series frame of a HistoryMatrix: total USD Value (+ the units of single_asset)."""
+    out = pd.DataFrame({"USD Value": m.usd.sum(axis=1)})
+    if single_asset is not None:
+        out["Holdings (Unit)"] = m.units[single_asset].fillna(0.0)
+    return out
+
+def _change_kpis(window: pd.DataFrame, history: pd.DataFrame) -> pd.DataFrame:
+    """MoM / YTD / CAGR in % for every column of _kpi_series at once (NaN without a valid baseline):
+      - MoM:  latest vs previous month of the filtered window
+      - YTD:  latest month of the window vs prior Dec of the full history
+      - CAGR: last 12 months of the full history (all of it if shorter), annualized"""
+    missing = pd.Series(np.nan, index=window.columns)
+    latest = window.iloc[-1]
+    prev = window.iloc[-2] if len(window) > 1 else missing
+    dec = pd.Timestamp(year=window.index[-1].year - 1, month=12, day=1)
+    prior_dec = history.loc[dec] if dec in history.index else missing
+    out = pd.DataFrame({"MoM": _pct_change(prev, latest), "YTD": _pct_change(prior_dec, latest), "CAGR": missing})
+
+    if len(history):
+        start, end = history.index[max(len(history) - 12, 0)], history.index[-1]
+        n_months = (end.year - start.year) * 12 + (end.month - start.month)
+        if n_months > 0:
+            first = history.loc[start]
+            out["CAGR"] = ((history.iloc[-1] / first.where(first > 0)) ** (12 / n_months) - 1) * 100.0
+    return out
 
 def _fmt_change(x: float):
     sign = "▲" if x > 0 else ("▼" if x < 0 else "—")
     return f"{x:+.1f}% {sign}"
 
-def _pct_change(old, new):
-    """Return float % change or None if invalid baseline."""
-    if old is None or old <= 0:
-        return None
-    return (new - old) / old * 100.0
+def _pct_change(old: pd.Series, new: pd.Series) -> pd.Series:
+    """% change per element, NaN where the baseline is missing or not positive."""
+    return ((new - old) / old * 100.0).where(old > 0)
 
 def _fmt_delta(x: float) -> str:
     """Format a % for st.metric(delta=...) or return None."""
@@ -371,8 +384,9 @@ def _fmt_pct_value(x, na="N/A"):
     """Render a percentage or N/A if baseline missing."""
     return f"{x:.1f}%" if (x is not None and np.isfinite(x)) else na
     
-def _compute_current_vs_last(df_current: pd.DataFrame, df_hist: pd.DataFrame, assets: list[str]):
+def _compute_current_vs_last(df_current: pd.DataFrame, history: pd.DataFrame, assets: list[str]):
     """
+    history: _kpi_series of the full historic matrix over `assets`.
     Returns:
       current_usd, last_usd, usd_delta_pct,
       current_units (if single asset), last_units, units_delta_pct
@@ -387,20 +401,16 @@ def _compute_current_vs_last(df_current: pd.DataFrame, df_hist: pd.DataFrame, as
         current_units = float(cur.loc[cur["Crypto Asset"] == a, "Holdings (Unit)"].sum())
 
     # last stored month in historic
-    hist = df_hist[df_hist["Crypto Asset"].isin(assets)]
-    if hist.empty:
+    if history.empty:
         return current_usd, None, None, current_units, None, None
 
-    last_date = pd.to_datetime(hist["Date"]).max()
-    last_month = hist[pd.to_datetime(hist["Date"]) == last_date]
-
-    last_usd = float(last_month["USD Value"].sum())
+    last_month = history.iloc[-1]
+    last_usd = float(last_month["USD Value"])
 
     last_units = None
     units_delta_pct = None
     if len(assets) == 1:
-        a = assets[0]
-        last_units = float(last_month.loc[last_month["Crypto Asset"] == a, "Holdings (Unit)"].sum())
+        last_units = float(last_month["Holdings (Unit)"])
         if last_units and last_units > 0 and current_units is not None:
             units_delta_pct = (current_units - last_units) / last_units * 100.0
 
@@ -424,65 +434,26 @@ def render_historic_kpis(df_filtered: pd.DataFrame):
             c3.metric("CAGR (units)", "N/A")
             return
 
-        # Working frames
-        dfw = df_filtered.copy()  # respects current UI filters
-        df_full = st.session_state.get("historic_df", dfw)  # for prior Dec baselines
-        
-        # ensure datetime (no-op if already)
-        dfw["Date"] = pd.to_datetime(dfw["Date"])
-        df_full["Date"] = pd.to_datetime(df_full["Date"])
+        # Working frames: date x asset matrices of the filtered window and of the full history
+        hm = history_matrix(df_filtered)  # current UI filters (shared)
+        assets_in_scope = sorted(hm.usd.columns.tolist())
+        single_asset = assets_in_scope[0] if len(assets_in_scope) == 1 else None
+        full = historic_matrix().select(assets_in_scope)  # prior Dec / CAGR baselines, same asset scope
 
-        # Dates
-        latest_date, prev_date = _latest_and_prev_dates(dfw["Date"])
-        assets_in_scope = sorted(dfw["Crypto Asset"].dropna().unique().tolist())
+        window = _kpi_series(hm, single_asset)
+        history = _kpi_series(full, single_asset)
+        kpis = _change_kpis(window, history)   # rows: USD Value (+ Holdings (Unit)); cols: MoM, YTD, CAGR
 
         # --- NEW: Current snapshot vs last stored month (USD), consistent across sections
         cur_usd, last_usd, cur_vs_last_usd_pct, cur_units, last_units, cur_vs_last_units_pct = _compute_current_vs_last(
             st.session_state["data_df"],   # current priced snapshot
-            st.session_state["historic_df"],  # full historic
+            history,  # full historic
             assets_in_scope
         )
 
         # --- Aggregate USD KPIs (always shown) ---
-        latest_total_usd = float(dfw.loc[dfw["Date"] == latest_date, "USD Value"].sum()) if latest_date is not None else 0.0
-        prev_total_usd   = float(dfw.loc[dfw["Date"] == prev_date,   "USD Value"].sum()) if prev_date   is not None else None
-
-        # Monthly % (USD)
-        monthly_change_usd = _pct_change(prev_total_usd, latest_total_usd)
-
-        # YTD % (USD) vs prior Dec (use full history but same asset scope)
-        latest_year = int(pd.to_datetime(latest_date).year) if latest_date is not None else None
-        ytd_base = df_full[df_full["Crypto Asset"].isin(assets_in_scope)] if assets_in_scope else df_full
-        prior_dec_total_usd = _year_end_total(ytd_base, latest_year - 1, "USD Value") if latest_year else None
-        ytd_change_usd = _pct_change(prior_dec_total_usd, latest_total_usd)
-
-
-        # --- CAGR window from full history (not the UI-filtered window) ---
-        df_cagr_base = df_full[df_full["Crypto Asset"].isin(assets_in_scope)] if assets_in_scope else df_full
-
-        months = pd.to_datetime(df_cagr_base["Date"]).dt.to_period("M").sort_values().unique()
-        if len(months) == 0:
-            # ultra-guard: no months found
-            start_period = end_period = None
-            first_total_usd_cagr = latest_total_usd_cagr = 0.0
-            n_months_cagr = 0
-            cagr_usd = None
-        else:
-            if len(months) >= 12:
-                start_period = months[-12]
-                end_period   = months[-1]
-            else:
-                start_period = months[0]
-                end_period   = months[-1]
-
-            start_mask = df_cagr_base["Date"].dt.to_period("M") == start_period
-            end_mask   = df_cagr_base["Date"].dt.to_period("M") == end_period
-
-            first_total_usd_cagr  = float(df_cagr_base.loc[start_mask, "USD Value"].sum())
-            latest_total_usd_cagr = float(df_cagr_base.loc[end_mask,   "USD Value"].sum())
-            n_months_cagr = (end_period.year - start_period.year) * 12 + (end_period.month - start_period.month)
-            cagr_usd = (((latest_total_usd_cagr / first_total_usd_cagr) ** (12 / n_months_cagr)) - 1) * 100.0 \
-                if (first_total_usd_cagr is not None and first_total_usd_cagr > 0 and n_months_cagr > 0) else None
+        ytd_change_usd = kpis.at["USD Value", "YTD"]
+        cagr_usd = kpis.at["USD Value", "CAGR"]
 
         with col1:
             with st.container(border=True):
@@ -515,31 +486,11 @@ def render_historic_kpis(df_filtered: pd.DataFrame):
 
         # --- Units KPIs only when exactly ONE asset is selected ---
 
-        single_asset = assets_in_scope[0] if len(assets_in_scope) == 1 else None
-
         with st.expander("Unit KPIs (single asset)", expanded = (single_asset is not None)):
 
             if single_asset:
-                dfw_asset = dfw[dfw["Crypto Asset"] == single_asset]
-
-                latest_units = float(dfw_asset.loc[dfw_asset["Date"] == latest_date, "Holdings (Unit)"].sum()) if latest_date is not None else 0.0
-                prev_units   = float(dfw_asset.loc[dfw_asset["Date"] == prev_date,   "Holdings (Unit)"].sum()) if prev_date   is not None else None
-
-                monthly_change_units = _pct_change(prev_units, latest_units)
-
-                ytd_base_asset = ytd_base[ytd_base["Crypto Asset"] == single_asset]
-                prior_dec_units = _year_end_total(ytd_base_asset, latest_year - 1, "Holdings (Unit)") if latest_year else None
-                ytd_change_units = _pct_change(prior_dec_units, latest_units)
-
-                # Units CAGR uses SAME window as USD CAGR but restricted to the single asset
-                if start_period is not None and n_months_cagr > 0:
-                    df_cagr_asset = df_cagr_base[df_cagr_base["Crypto Asset"] == single_asset]
-                    first_units_cagr  = float(df_cagr_asset.loc[df_cagr_asset["Date"].dt.to_period("M") == start_period, "Holdings (Unit)"].sum())
-                    latest_units_cagr = float(df_cagr_asset.loc[df_cagr_asset["Date"].dt.to_period("M") == end_period,   "Holdings (Unit)"].sum())
-                    cagr_units = (((latest_units_cagr / first_units_cagr) ** (12 / n_months_cagr)) - 1) * 100.0 \
-                        if (first_units_cagr and first_units_cagr > 0) else None
-                else:
-                    cagr_units = None
+                ytd_change_units = kpis.at["Holdings (Unit)", "YTD"]
+                cagr_units = kpis.at["Holdings (Unit)", "CAGR"]
 
                 c1, c2, c3 = st.columns(3)
 
@@ -572,78 +523,6 @@ def render_historic_kpis(df_filtered: pd.DataFrame):
                 st.caption("Select a single asset to view unit‑based KPIs.")
 
 
-def _coerce_num(s: pd.Series) -> pd.Series:
-    """Parse numbers from both US and EU formats. Returns float Series."""
-    s1 = pd.to_numeric(s, errors="coerce")
-    if s1.isna().mean() > 0.5:
-        s_alt = (s.astype(str)
-                   .str.replace(r"\s", "", regex=True)
-                   .str.replace(".", "", regex=False)
-                   .str.replace(",", ".", regex=False))
-        s1 = pd.to_numeric(s_alt, errors="coerce")
-    return s1
-
-def _fmt_usd(x: float) -> str:
-    try:
-        if abs(x) >= 1e9:  return f"${x/1e9:,.1f}B"
-        if abs(x) >= 1e6:  return f"${x/1e6:,.1f}M"
-        if abs(x) >= 1e3:  return f"${x/1e3:,.1f}K"
-        return f"${x:,.0f}"
-    except Exception:
-        return "$0"
-
-def _prep_history(hist: pd.DataFrame) -> pd.DataFrame:
-    """Normalize columns, ensure numerics, derive Price USD if missing, ffill/bfill per asset."""
-    h = hist.copy()
-    if "Date" not in h.columns:
-        if "date" in h.columns:
-            h["Date"] = pd.to_datetime(h["date"])
-        else:
-            h["Date"] = pd.to_datetime(dict(year=h["Year"], month=h["Month"], day=1), errors="coerce")
-
-    h = h.rename(columns=lambda c: str(c).strip())
-    alias = {
-        "Price": "Price USD", "Price_USD": "Price USD",
-        "USD": "USD Value",   "USD_Value": "USD Value",
-        "Holdings": "Holdings (Unit)", "Units": "Holdings (Unit)",
-    }
-    for k, v in alias.items():
-        if k in h.columns and v not in h.columns:
-            h.rename(columns={k: v}, inplace=True)
-
-    for col in ["Holdings (Unit)", "USD Value", "Price USD"]:
-        if col not in h.columns:
-            h[col] = np.nan
-
-    h["Holdings (Unit)"] = _coerce_num(h["Holdings (Unit)"])
-    h["USD Value"]       = _coerce_num(h["USD Value"])
-    h["Price USD"]       = _coerce_num(h["Price USD"])
-
-    need_p = h["Price USD"].isna()
-    with np.errstate(divide="ignore", invalid="ignore"):
-        implied = h["USD Value"] / h["Holdings (Unit)"]
-    h.loc[need_p, "Price USD"] = implied[need_p]
-
-    need_usd = h["USD Value"].isna() & h["Price USD"].notna() & h["Holdings (Unit)"].notna()
-    h.loc[need_usd, "USD Value"] = h.loc[need_usd, "Price USD"] * h.loc[need_usd, "Holdings (Unit)"]
-
-    h = h.sort_values(["Crypto Asset", "Date"]).reset_index(drop=True)
-    h["Price USD"] = h["Price USD"].groupby(h["Crypto Asset"], sort=False).transform(lambda s: s.ffill().bfill())
-    return h
-
-def _decompose_asset(g: pd.DataFrame) -> pd.DataFrame:
-    """Exact ΔUSD decomposition per asset:
-       ΔUSD = units_prev * Δprice  +  price_curr * Δunits
-    """
-    g = g.sort_values("Date").copy()
-    g["units_prev"] = g["Holdings (Unit)"].shift()
-    g["price_prev"] = g["Price USD"].shift()
-    g["d_usd"] = g["USD Value"].diff()
-    g["price_effect"] = (g["Price USD"] - g["price_prev"]) * g["units_prev"]
-    g["units_effect"] = (g["Holdings (Unit)"] - g["units_prev"]) * g["Price USD"]
-    g = g.dropna(subset=["d_usd", "price_effect", "units_effect"])
-    return g
-
 def render_flow_decomposition(df_hist_filtered: pd.DataFrame):
     """
     Render 'Flow & Decomposition (Price vs Accumulation)' using the ALREADY-filtered historic df.
@@ -654,12 +533,12 @@ def render_flow_decomposition(df_hist_filtered: pd.DataFrame):
         st.info("No historic data for the current filters.")
         return
 
-    hist = _prep_history(df_hist_filtered)
+    decomp = asset_flows(df_hist_filtered)   # vectorized over all assets, cached per filter
 
     with st.container(border=True):
         st.markdown("### Flow & Decomposition (Price vs Accumulation)", help="Shows whether growth came from new units or price beta by splitting monthly USD Delta into “Delta Price on prior units” vs “Delta Units at current price”.")
 
-        c1, c2 = st.columns([1, 1])
+        c1, c2, c3 = st.columns([1, 1, 1])
 
         # Single-asset toggle (aggregated vs one asset)
         view_mode = c1.radio(
@@ -670,61 +549,61 @@ def render_flow_decomposition(df_hist_filtered: pd.DataFrame):
             help="Aggregate sums across selected assets or inspect a single asset."
         )
         if view_mode == "Single asset":
-            assets_in_scope = sorted(hist["Crypto Asset"].dropna().unique().tolist())
+            assets_in_scope = sorted(df_hist_filtered["Crypto Asset"].dropna().unique().tolist())
             asset_pick = c2.selectbox("Asset", assets_in_scope, index=0)
         else:
             asset_pick = None
 
-        # Decompose per asset, then aggregate if needed
-        decomp = (hist.groupby("Crypto Asset", group_keys=True)
-                        .apply(_decompose_asset)
-                        .reset_index(drop=True))
+        cumulative = c3.toggle(
+            "Cumulative", value=False,
+            help="Running total of each effect since the start of the selected time range."
+        )
 
         if decomp.empty:
             st.info("Not enough monthly history to compute flows for the current selection.")
             return
 
         if asset_pick:
-            view = decomp[decomp["Crypto Asset"] == asset_pick].copy()
+            view = decomp[decomp["Crypto Asset"] == asset_pick]
             bar_color_price = "#8892a6"
             bar_color_units = COLORS.get(asset_pick, "#43d1a0")
         else:
-            view = (decomp.groupby("Date")[["d_usd", "price_effect", "units_effect"]]
-                          .sum()
-                          .reset_index())
+            view = total_flows(df_hist_filtered)
             bar_color_price = "#8892a6"
             bar_color_units = "#43d1a0"
 
-        # KPIs (last month)
+        # KPIs (last month, or the whole range when cumulative)
+        pre = "cum_" if cumulative else ""
+        period = "since start" if cumulative else "last month"
         last = view.sort_values("Date").tail(1)
-        d_usd = float(last["d_usd"].iloc[0]) if not last.empty else 0.0
-        pe    = float(last["price_effect"].iloc[0]) if not last.empty else 0.0
-        ue    = float(last["units_effect"].iloc[0]) if not last.empty else 0.0
+        d_usd = float(last[pre + "d_usd"].iloc[0]) if not last.empty else 0.0
+        pe    = float(last[pre + "price_effect"].iloc[0]) if not last.empty else 0.0
+        ue    = float(last[pre + "units_effect"].iloc[0]) if not last.empty else 0.0
 
         k1, k2, k3 = st.columns(3)
         with k1:
             with st.container(border=True):
-                st.metric("ΔUSD (last month)", _fmt_usd(d_usd))
+                st.metric(f"ΔUSD ({period})", format_usd(d_usd))
         with k2:
             with st.container(border=True):
-                st.metric("Price contribution", _fmt_usd(pe),
+                st.metric("Price contribution", format_usd(pe),
                   help="Effect from price changing on prior units.")
         with k3:
             with st.container(border=True):
-                st.metric("Units contribution", _fmt_usd(ue),
+                st.metric("Units contribution", format_usd(ue),
                   help="Effect from accumulation/reduction of units at current price.")
 
         # Chart
         fig = go.Figure()
         fig.add_bar(
             name="Price effect",
-            x=view["Date"], y=view["price_effect"],
+            x=view["Date"], y=view[pre + "price_effect"],
             marker_color=bar_color_price,
             hovertemplate="Date: %{x|%b %Y}<br>Price: %{y:$,.0f}<extra></extra>",
         )
         fig.add_bar(
             name="Units effect",
-            x=view["Date"], y=view["units_effect"],
+            x=view["Date"], y=view[pre + "units_effect"],
             marker_color=bar_color_units,
             hovertemplate="Date: %{x|%b %Y}<br>Units: %{y:$,.0f}<extra></extra>",
         )
@@ -733,7 +612,7 @@ def render_flow_decomposition(df_hist_filtered: pd.DataFrame):
             height=360,
             margin=dict(l=40, r=20, t=10, b=30),
             xaxis=dict(title=None, tickformat="%b %Y"),
-            yaxis=dict(title="ΔUSD", tickprefix="$"),
+            yaxis=dict(title="Cumulative ΔUSD" if cumulative else "ΔUSD", tickprefix="$"),
             legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="center", x=0.5),
             hoverlabel=dict(align="left"),
         )
@@ -751,4 +630,49 @@ def render_flow_decomposition(df_hist_filtered: pd.DataFrame):
         render_plotly(fig, filename=f"flows_{asset_pick or 'agg'}".lower(), width="stretch")
 
         st.caption("Note: Decomposition uses **asset-level monthly aggregates**; it respects the *filters (assets + time)*. "
-                   "Entity Type and Country filters are not applied unless history exists at that granularity.")
\ No newline at end of file
+                   "Entity Type and Country filters are not applied unless history exists at that granularity.")
+
+def _leaderboard_table(rows: pd.DataFrame):
+    disp = pd.DataFrame({
+        "Entity": rows["Entity Name"].to_numpy(),
+        "Units effect": usd_labels(rows["units_effect"]),
+        "Price effect": usd_labels(rows["price_effect"]),
+        "ΔUSD": usd_labels(rows["d_usd"]),
+    })
+    st.dataframe(disp, width="stretch", hide_index=True, height=min(400, 38*(len(disp)+1)+6))
+
+
+def render_entity_flow_leaderboard(df_hist_filtered: pd.DataFrame):
+    """Top accumulators / sellers of the latest month from the entity history store,
+    over the assets selected on the Trends page."""
+    with st.container(border=True):
+        st.markdown("### Top Accumulators & Sellers", help="Per-entity split of the monthly USD Delta into “Delta Price on prior units” vs “Delta Units at current price”, ranked by the units effect (USD bought or sold).")
+
+        store = load_entity_history()
+        history = store.monthly()
+        if history["Date"].nunique() < 2:
+            st.info("Entity-level history needs snapshots from at least two months; it is recorded with every data refresh.")
+            return
+
+        assets = sorted(df_hist_filtered["Crypto Asset"].dropna().unique().tolist())
+        flows = get_entity_flows(store.version, history, current_historic(),
+                                 price_map(st.session_state["prices"]), assets=assets)
+        buyers, sellers = flow_leaderboard(flows, n=10)
+        month = pd.Timestamp(flows["Date"].max()).strftime("%B %Y") if not flows.empty else ""
+
+        c1, c2 = st.columns(2)
+        with c1:
+            st.markdown(f"#### Top Accumulators ({month})")
+            if buyers.empty:
+                st.caption("No net accumulation this month.")
+            else:
+                _leaderboard_table(buyers)
+        with c2:
+            st.markdown(f"#### Top Sellers ({month})")
+            if sellers.empty:
+                st.caption("No net reductions this month.")
+            else:
+                _leaderboard_table(sellers)
+
+        st.caption("Note: Uses the monthly entity snapshots of the tracker (latest refresh of each month) "
+                   "with prices implied by the historic data and live prices for the current month.")
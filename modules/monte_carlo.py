@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+from modules.nav_matrix import NavMatrix
+from modules.flows import implied_prices
+
+
+MAX_BLOCK = 4_000_000   # entity x draw cells held at once while summarizing a simulation
+
+_last_model = [None, None]   # (historic frame, its ReturnModel): historic frames are shared, so rebuild only on a new one
+
+
+class ReturnModel:
+    """Joint normal model of monthly log returns per asset, estimated from the implied prices.
+    Draws are correlated through a PSD factor of the covariance matrix (eigenvalues clipped
+    at 0, so a short or collinear history still yields a valid factor)."""
+
+    def __init__(self, prices: pd.DataFrame, min_periods: int = 3):
+        rets = np.log(prices).diff().iloc[1:]
+        rets = rets.loc[:, rets.count() >= min_periods]
+        cov = rets.cov(min_periods=min_periods).fillna(0.0).to_numpy()
+        w, v = np.linalg.eigh((cov + cov.T) / 2)
+
+        self.assets = pd.Index(rets.columns, name="Crypto Asset")
+        self.mu = rets.mean().to_numpy(dtype=float)
+        self.factor = v * np.sqrt(np.clip(w, 0.0, None))   # cov = factor @ factor.T
+        self.n_obs = len(rets)
+
+    @classmethod
+    def from_historic(cls, historic_df: pd.DataFrame) -> "ReturnModel":
+        return cls(implied_prices(historic_df))
+
+    def draw_shocks(self, assets, n_draws: int, horizon: int = 1, drift: bool = False, seed=None) -> np.ndarray:
+        """assets x draws matrix of simple price changes over `horizon` months.
+        Assets without enough history get a zero shock."""
+        rng = np.random.default_rng(seed)
+        z = rng.standard_normal((len(self.assets), n_draws))
+        logr = np.sqrt(horizon) * (self.factor @ z)
+        if drift:
+            logr += horizon * self.mu[:, None]
+        shocks = np.zeros((len(assets), n_draws))
+        pos = self.assets.get_indexer(pd.Index(assets))
+        hit = pos >= 0
+        shocks[hit] = np.expm1(logr[pos[hit]])
+        return shocks
+
+
+def get_return_model(historic_df: pd.DataFrame) -> ReturnModel:
+    """ReturnModel of the shared historic frame, estimated once per frame."""
+    df, model = _last_model
+    if df is not historic_df:
+        model = ReturnModel.from_historic(historic_df)
+        _last_model[:] = [historic_df, model]
+    return model
+
+
+def _tail_stats(block: np.ndarray, percentiles, level: float):
+    """Percentiles (linear interpolation, as np.percentile) and expected shortfall (mean of
+    the worst `level` share of draws) per row, from a single partial sort."""
+    n = block.shape[1]
+    pos = np.asarray(percentiles, dtype=float) / 100.0 * (n - 1)
+    lo, hi = np.floor(pos).astype(int), np.ceil(pos).astype(int)
+    k = max(1, int(np.ceil(level * n)))
+    part = np.partition(block, sorted({*lo, *hi, k - 1}), axis=1)
+    frac = pos - lo
+    pct = part[:, lo] * (1 - frac) + part[:, hi] * frac
+    return pct, part[:, :k].mean(axis=1)
+
+
+def tail_stats(values: np.ndarray, percentiles=(5, 50), level: float = 0.05):
+    """(percentiles, expected shortfall) of a 1-D sample, with the same rules as the
+    simulate table: ES is the mean of the worst ceil(level * n) values."""
+    pct, es = _tail_stats(np.asarray(values, dtype=float)[None, :], percentiles, level)
+    return pct[0], float(es[0])
+
+
+def simulate(nav: NavMatrix, model: ReturnModel, n_draws: int = 20_000, horizon: int = 1,
+             percentiles=(5, 50, 95), es_level: float = 0.05, drift: bool = False, seed=None):
+    """Monte Carlo of crypto price scenarios through the entity x asset NAV matrix.
+
+    Returns (per-entity table, total ΔNAV per draw). The table has the mean, percentiles
+    and expected shortfall (mean of the worst es_level share of draws) of ΔNAV in USD
+    and of the implied equity move in % of market cap. ΔNAV for all draws is one
+    matrix product, summarized in entity blocks of at most MAX_BLOCK cells."""
+    shocks = model.draw_shocks(nav.assets, n_draws, horizon=horizon, drift=drift, seed=seed)
+    qs = list(percentiles)
+    mean = np.empty(len(nav.entities))
+    pct = np.empty((len(nav.entities), len(qs)))
+    es = np.empty(len(nav.entities))
+
+    step = max(1, MAX_BLOCK // max(1, n_draws))
+    for start in range(0, len(nav.entities), step):
+        block = nav.nav[start:start + step] @ shocks
+        sl = slice(start, start + len(block))
+        mean[sl] = block.mean(axis=1)
+        pct[sl], es[sl] = _tail_stats(block, qs, es_level)
+
+    table = pd.DataFrame({"Entity Name": nav.entities, "MarketCap": nav.mcap,
+                          "CryptoNAV": nav.nav.sum(axis=1), "Mean ΔNAV": mean})
+    for i, q in enumerate(qs):
+        table[f"ΔNAV P{q:g}"] = pct[:, i]
+    table["ΔNAV ES"] = es
+
+    scale = 100.0 / nav.mcap   # ΔNAV -> implied equity move in %; linear, so quantiles carry over
+    table["Mean Move %"] = mean * scale
+    for i, q in enumerate(qs):
+        table[f"Move P{q:g} %"] = pct[:, i] * scale
+    table["Move ES %"] = es * scale
+
+    total = nav.nav.sum(axis=0) @ shocks
+    return table, total
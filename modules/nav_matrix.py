@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+from modules.view_cache import derived
+
+
+class NavMatrix:
+    """Crypto-NAV per (entity, asset) as a dense entities x assets matrix plus one
+    market cap per entity. Only entities with a positive market cap are kept.
+    A shock vector (one %-change per asset) is then a single matrix-vector product
+    and a grid of scenarios a single matrix-matrix product."""
+
+    def __init__(self, df: pd.DataFrame):
+        ec, entities = pd.factorize(df["Entity Name"], sort=True)   # sorted like the groupby it replaces
+        ac, assets = pd.factorize(df["Crypto Asset"], sort=True)
+        ok = (ec >= 0) & (ac >= 0)
+        ec, ac = ec[ok], ac[ok]
+        usd = np.nan_to_num(df["USD Value"].to_numpy(dtype=float)[ok])
+        mcap = df["Market Cap"].to_numpy(dtype=float)[ok]
+
+        nav = np.zeros((len(entities), len(assets)))
+        np.add.at(nav, (ec, ac), usd)
+        cap = np.full(nav.shape, np.nan)
+        np.fmax.at(cap, (ec, ac), mcap)          # NaN-skipping max, NaN where no rows
+        with np.errstate(invalid="ignore"):
+            valid = cap > 0                      # False for NaN as well
+        keep = valid.any(axis=1)
+
+        self.entities = pd.Index(entities[keep], name="Entity Name")
+        self.assets = pd.Index(assets, name="Crypto Asset")
+        self.nav = np.where(valid, nav, 0.0)[keep]
+        self.mcap = np.where(valid, cap, -np.inf).max(axis=1, initial=-np.inf)[keep]
+
+    @property
+    def empty(self) -> bool:
+        return len(self.entities) == 0
+
+    def shock_vector(self, uniform: float | None = None, per_asset: dict | None = None) -> np.ndarray:
+        """One shock per asset column; per_asset ({asset: pct}, missing assets 0) wins over uniform."""
+        if per_asset:
+            return np.array([float(per_asset.get(a, 0.0)) for a in self.assets], dtype=float)
+        return np.full(len(self.assets), float(uniform or 0.0))
+
+    def deltas(self, shocks) -> np.ndarray:
+        """ΔMarket Cap (USD) per entity for a shock vector, or per entity x scenario
+        for an assets x scenarios shock matrix."""
+        return self.nav @ np.asarray(shocks, dtype=float)
+
+    def impact(self, deltas: np.ndarray) -> np.ndarray:
+        """Implied equity move in % of market cap (shares assumed constant)."""
+        m = self.mcap if np.ndim(deltas) == 1 else self.mcap[:, None]
+        return deltas / m * 100.0
+
+    def scenario_grid(self, scenarios: dict) -> pd.DataFrame:
+        """Implied equity move (%) per entity for each named scenario, one column each.
+        scenarios: {name: uniform pct or {asset: pct}}."""
+        shocks = np.column_stack([
+            self.shock_vector(per_asset=s) if isinstance(s, dict) else self.shock_vector(uniform=s)
+            for s in scenarios.values()
+        ]) if scenarios else np.zeros((len(self.assets), 0))
+        return pd.DataFrame(self.impact(self.deltas(shocks)), index=self.entities, columns=list(scenarios))
+
+
+def get_nav_matrix(df: pd.DataFrame) -> NavMatrix:
+    """NavMatrix of df, built once per cached view (per price snapshot and filter)."""
+    return derived(df, "nav_matrix", NavMatrix)
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+
+
+# Cells that mean "no value" rather than a malformed number
+NA_TOKENS = ["", "-", "—", "n/a", "N/A", "na", "NA", "None", "none", "nan", "NaN"]
+_STRIP = r"[\s $€%']"   # whitespace, nbsp, currency/percent signs, Swiss thousands
+
+
+def _to_float(strs: pd.Series, fmt: str) -> pd.Series:
+    if fmt == "plain":
+        return pd.to_numeric(strs, errors="coerce")
+    t = strs.str.replace(_STRIP, "", regex=True)
+    if fmt == "eu":    # 1.234.567,89
+        t = t.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    else:              # us: 1,234,567.89
+        t = t.str.replace(",", "", regex=False)
+    return pd.to_numeric(t, errors="coerce")
+
+
+_US_GROUPED = r"^[+-]?\d{1,3}(?:,\d{3})+$"    # 1,234 / 1,234,567: US thousands (or an EU decimal)
+_EU_GROUPED = r"^[+-]?\d{1,3}(?:\.\d{3})+$"   # 1.234 / 1.234.567: EU thousands (or a plain decimal)
+
+
+def _auto_formats(t: pd.Series) -> np.ndarray:
+    """Per-cell format ("plain", "eu", "us") of stripped text cells for fmt="auto".
+    With both separators the last one is the decimal mark; 1,5 is EU; repeated dots are EU
+    and repeated commas US thousands. Cells that read either way (1,234 / 1.234) follow
+    the majority of the column's unambiguous cells, else US thousands / plain decimal."""
+    last_c, last_d = t.str.rfind(","), t.str.rfind(".")
+    has_c, has_d = last_c >= 0, last_d >= 0
+    us_grouped, eu_grouped = t.str.match(_US_GROUPED), t.str.match(_EU_GROUPED)
+    eu = ((has_c & has_d & (last_c > last_d)) | (has_c & ~has_d & ~us_grouped)
+          | (t.str.count(r"\.") > 1)).to_numpy()
+    us = ((has_c & has_d & (last_d > last_c)) | (t.str.count(",") > 1)).to_numpy() & ~eu
+    column_eu = eu.sum() > us.sum()
+
+    fmt = np.full(len(t), "plain", dtype=object)
+    fmt[us] = "us"
+    fmt[eu] = "eu"
+    fmt[us_grouped.to_numpy() & ~us & ~eu] = "eu" if column_eu else "us"
+    fmt[eu_grouped.to_numpy() & ~us & ~eu] = "eu" if column_eu else "plain"
+    return fmt
+
+
+def parse_numbers(s: pd.Series, fmt: str = "auto", return_rejected: bool = False):
+    """Vectorized number parsing for sheet columns.
+    fmt: "eu" (1.234,5), "us" (1,234.5), "plain" (pd.to_numeric only) or
+         "auto" (decided per cell, see _auto_formats).
+    Numeric cells (e.g. UNFORMATTED_VALUE responses) are taken as is; a fully
+    numeric column skips string handling entirely.
+    With return_rejected=True also returns the index of non-empty cells that failed."""
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        out = s.astype(float)
+        return (out, s.index[:0]) if return_rejected else out
+
+    obj = s.astype(object)
+    kind = pd.api.types.infer_dtype(obj, skipna=True)
+    if kind in ("integer", "floating", "mixed-integer-float", "decimal", "empty"):
+        out = pd.to_numeric(obj, errors="coerce").astype(float)
+        return (out, s.index[:0]) if return_rejected else out
+
+    # split numeric cells (taken as is) from text cells (parsed); positional to allow duplicate labels
+    vals = np.full(len(obj), np.nan)
+    try:
+        is_text = obj.str.len().notna().to_numpy()
+    except AttributeError:   # no text cells at all
+        is_text = np.zeros(len(obj), dtype=bool)
+    is_num = ~is_text & obj.notna().to_numpy()
+    if is_num.any():
+        vals[is_num] = pd.to_numeric(obj[is_num], errors="coerce").to_numpy(dtype=float)
+
+    text = obj[is_text].str.strip()
+    keep = ~text.isin(NA_TOKENS).to_numpy()
+    pos = np.flatnonzero(is_text)[keep]
+    if len(pos):
+        text = text[keep]
+        if fmt == "auto":
+            text = text.str.replace(_STRIP, "", regex=True)
+            cell_fmt = _auto_formats(text)
+            parsed = np.full(len(text), np.nan)
+            for f in ("plain", "eu", "us"):
+                hit = cell_fmt == f
+                if hit.any():
+                    parsed[hit] = _to_float(text[hit], f).to_numpy(dtype=float)
+            vals[pos] = parsed
+        else:
+            vals[pos] = _to_float(text, fmt).to_numpy(dtype=float)
+
+    out = pd.Series(vals, index=s.index, name=s.name)
+    rejected = s.index[pos[np.isnan(vals[pos])]]
+    return (out, rejected) if return_rejected else out
+
+
+def log_rejected(label: str, s: pd.Series, rejected: pd.Index, max_show: int = 5):
+    """Print a short report of cells parse_numbers could not read."""
+    if len(rejected):
+        sample = ", ".join(repr(v) for v in s.loc[rejected[:max_show]].tolist())
+        print(f"{label}: {len(rejected)} unparseable value(s) set to NaN, e.g. {sample}")
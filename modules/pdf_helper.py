@@ -1,16 +1,6 @@
 from datetime import datetime
 import streamlit as st
-
-def _pretty_usd(x):
-    if x is None or (isinstance(x, float) and x != x):
-        return "-"
-    x = float(x)
-    ax = abs(x)
-    if ax >= 1e12:  return f"${x/1e12:.2f}T"
-    if ax >= 1e9:   return f"${x/1e9:.2f}B"
-    if ax >= 1e6:   return f"${x/1e6:.2f}M"
-    if ax >= 1e3:   return f"${x/1e3:.2f}K"
-    return f"${x:,.0f}"
+from modules.formatting import usd_labels
 
 def _table_pdf_bytes(df, logo_map, title="Treasury ranking list"):
     try:
@@ -209,7 +199,12 @@ def _table_pdf_bytes(df, logo_map, title="Treasury ranking list"):
     rows_on_page = 0
 
     row_h = 8
-    for rank, row in df.iterrows():
+    # USD columns formatted in one pass (dash if NA)
+    no_col = [None] * len(df)
+    uv_labels = usd_labels(df["USD Value"] if "USD Value" in df.columns else no_col, decimals=2)
+    mc_labels = usd_labels(df["Market Cap"] if "Market Cap" in df.columns else no_col, decimals=2)
+
+    for i, (rank, row) in enumerate(df.iterrows()):
         # page break guard
         if rows_on_page >= MAX_ROWS_PER_PAGE or pdf.get_y() + row_h > (pdf.h - pdf.b_margin):
             pdf.add_page()
@@ -282,12 +277,12 @@ def _table_pdf_bytes(df, logo_map, title="Treasury ranking list"):
 
         # USD Value (pretty, dash if NA)
         pdf.set_xy(col_x[8], y)
-        uv_txt = _pretty_usd(row.get("USD Value", None))
+        uv_txt = uv_labels[i]
         pdf.cell(col_w[8], row_h, uv_txt, border=1, align="R")
 
         # Market Cap (USD pretty, dash if NA)
         pdf.set_xy(col_x[9], y)
-        mc_txt = _pretty_usd(row.get("Market Cap", None))
+        mc_txt = mc_labels[i]
         pdf.cell(col_w[9], row_h, mc_txt, border=1, align="R")
 
         # mNAV (2dp, dash if NA)
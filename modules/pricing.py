@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+
+# Columns that depend on prices; everything else in the units frame is price-independent
+PRICED_COLUMNS = ["USD Value", "mNAV", "Premium", "TTMCR"]
+
+
+class PricingBase:
+    """Price-independent part of a units snapshot kept as contiguous arrays.
+    Repricing is one gather-multiply (price per asset code x holdings) plus the
+    ratio columns; the units columns are shared with the priced frame, not copied."""
+
+    def __init__(self, units_df: pd.DataFrame):
+        stale = [c for c in PRICED_COLUMNS if c in units_df.columns]
+        self.units = units_df.drop(columns=stale) if stale else units_df
+        self.codes, self.assets = pd.factorize(units_df["Crypto Asset"])   # code -1 = missing asset
+        self.holdings = units_df["Holdings (Unit)"].to_numpy(dtype=float)
+        self.mcap = units_df["Market Cap"].to_numpy(dtype=float)
+        self.mcap_ok = self.mcap > 0   # False for NaN as well
+
+    def usd_values(self, price_map: dict) -> np.ndarray:
+        # one price per distinct asset; the extra trailing slot (0.0) serves code -1
+        lookup = np.array([price_map.get(a, np.nan) for a in self.assets] + [np.nan], dtype=float)
+        return np.nan_to_num(lookup, nan=0.0)[self.codes] * self.holdings
+
+    def price(self, price_map: dict) -> pd.DataFrame:
+        """Units frame + USD Value, mNAV, Premium and TTMCR for the given {asset: price}."""
+        usd = self.usd_values(price_map)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = self.mcap / usd
+            nav_ok = self.mcap_ok & (usd > 0)
+            priced = {
+                "USD Value": usd,
+                # mNAV multiple -> Market Cap over crypto NAV
+                "mNAV": np.where(nav_ok, ratio, np.nan).round(2),
+                # Premium or Discount percent -> equals mNAV minus 1
+                "Premium": np.where(nav_ok, (ratio - 1) * 100, np.nan).round(2),
+                # Treasury to Market Cap ratio percent -> share of company value in crypto
+                "TTMCR": np.where(self.mcap_ok, usd / self.mcap * 100, np.nan).round(2),
+            }
+        df = self.units.copy(deep=False)   # shares the units columns
+        for col, values in priced.items():
+            df[col] = values
+        return df
@@ -0,0 +1,62 @@
+import threading
+from datetime import datetime, timezone
+import gspread
+import streamlit as st
+from google.oauth2.service_account import Credentials
+from google.auth.transport.requests import Request
+from google.auth.exceptions import RefreshError
+
+
+SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+SHEET_NAME = "master_table_v01"
+TOKEN_REFRESH_MARGIN = 600   # seconds before expiry at which the access token is renewed
+
+# ---- singletons ----
+# One authorized client per process: its AuthorizedSession keeps HTTP connections
+# alive across refreshes, and the spreadsheet handle saves the Drive lookup.
+_lock = threading.Lock()
+_pool = {}
+
+
+def _token_expiring(creds) -> bool:
+    if not creds.token or creds.expiry is None:
+        return True
+    now = datetime.now(timezone.utc).replace(tzinfo=None)  # google-auth uses naive UTC
+    return (creds.expiry - now).total_seconds() < TOKEN_REFRESH_MARGIN
+
+
+def get_spreadsheet():
+    """Pooled handle to the master spreadsheet; the token is renewed ahead of expiry."""
+    with _lock:
+        if not _pool:
+            creds = Credentials.from_service_account_info(st.secrets["gcp_service_account"], scopes=SCOPE)
+            client = gspread.authorize(creds)
+            _pool.update(creds=creds, client=client, sheet=client.open(SHEET_NAME))
+        if _token_expiring(_pool["creds"]):
+            _pool["creds"].refresh(Request())
+        return _pool["sheet"]
+
+
+def reset_client():
+    with _lock:
+        _pool.clear()
+
+
+def is_auth_error(e: Exception) -> bool:
+    """Expired or revoked credentials: a failed token refresh or HTTP 401 from the API."""
+    if isinstance(e, RefreshError):
+        return True
+    return getattr(getattr(e, "response", None), "status_code", None) == 401
+
+
+def with_spreadsheet(fn):
+    """Call fn(sheet) with the pooled handle. On an auth failure rebuild the client
+    once and retry; other errors (e.g. 429 quota) and empty results are returned as is,
+    since re-authorizing would only add API calls."""
+    try:
+        return fn(get_spreadsheet())
+    except Exception as e:
+        if not is_auth_error(e):
+            raise
+    reset_client()
+    return fn(get_spreadsheet())
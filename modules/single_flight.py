@@ -0,0 +1,41 @@
+import threading
+
+
+_lock = threading.Lock()
+_inflight = {}   # key -> _Call currently running
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def single_flight(key: str, fn):
+    """Run fn() once for all concurrent callers with the same key.
+    The first caller executes it; callers arriving while it runs block and get
+    the same result (or exception). Later callers start a new flight."""
+    with _lock:
+        call = _inflight.get(key)
+        leader = call is None
+        if leader:
+            call = _inflight[key] = _Call()
+
+    if not leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        call.result = fn()
+        return call.result
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+        call.done.set()
+
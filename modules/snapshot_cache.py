@@ -0,0 +1,88 @@
+import os, json, time, hashlib, threading
+import pandas as pd
+
+
+SNAPSHOT_DIR = "data/snapshots"
+SNAPSHOT_SCHEMA = 2          # bump when the typed layout of a loader output changes
+REFRESH_INTERVAL = 900       # seconds before a snapshot is refetched in the background
+
+_refresh_lock = threading.Lock()
+_refreshing = set()
+_last_attempt = {}
+
+
+def _paths(name: str):
+    base = os.path.join(SNAPSHOT_DIR, name)
+    return base + ".parquet", base + ".json"
+
+
+def frame_version(df: pd.DataFrame) -> str:
+    """Content hash of a frame (columns + values), stable across processes."""
+    h = hashlib.sha1("|".join(map(str, df.columns)).encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return h.hexdigest()[:16]
+
+
+def save_snapshot(name: str, df: pd.DataFrame) -> dict | None:
+    """Write the typed frame as Parquet plus a JSON version stamp. Returns the stamp."""
+    data_path, meta_path = _paths(name)
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        meta = {
+            "version": frame_version(df),
+            "schema": SNAPSHOT_SCHEMA,
+            "saved_at": time.time(),
+            "rows": int(len(df)),
+        }
+        # write to temp files first so readers never see a half-written snapshot
+        df.to_parquet(data_path + ".tmp", index=False)
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(data_path + ".tmp", data_path)
+        os.replace(meta_path + ".tmp", meta_path)
+        return meta
+    except Exception as e:
+        print(f"snapshot save failed for {name}: {e}")
+        return None
+
+
+def load_snapshot(name: str):
+    """Return (df, meta) from disk, or (None, None) if missing, unreadable or outdated."""
+    data_path, meta_path = _paths(name)
+    if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+        return None, None
+    try:
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        if meta.get("schema") != SNAPSHOT_SCHEMA:
+            return None, None
+        return pd.read_parquet(data_path), meta
+    except Exception:
+        return None, None
+
+
+def refresh_in_background(name: str, fetch, meta: dict | None = None, interval: float = REFRESH_INTERVAL) -> bool:
+    """Refetch `name` on a daemon thread and rewrite its snapshot.
+    At most one refresh per snapshot runs at a time, and none while the snapshot
+    (or the last attempt) is younger than `interval`. Returns True if a refresh started."""
+    now = time.time()
+    with _refresh_lock:
+        last = max((meta or {}).get("saved_at", 0.0), _last_attempt.get(name, 0.0))
+        if name in _refreshing or now - last < interval:
+            return False
+        _refreshing.add(name)
+        _last_attempt[name] = now
+
+    def _run():
+        try:
+            df = fetch()
+            if df is not None and not df.empty:
+                save_snapshot(name, df)
+        except Exception as e:
+            print(f"background refresh failed for {name}: {e}")
+        finally:
+            with _refresh_lock:
+                _refreshing.discard(name)
+
+    threading.Thread(target=_run, name=f"snapshot-refresh-{name}", daemon=True).start()
+    return True
@@ -0,0 +1,68 @@
+import time, threading
+import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from modules.data_loader import get_prices, load_units, load_historic_data
+from modules.dataset_store import get_dataset, get_historic
+from modules.swr_cache import data_age
+
+
+STARTUP_BUDGET_S = 2.0   # target wall time for the one-time session init
+
+# ---- singletons ----
+_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ctt-startup")
+
+
+def _submit(timings: dict, stage: str, fn):
+    ctx = get_script_run_ctx()
+
+    def _run():
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        t0 = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            timings[stage] = time.perf_counter() - t0
+
+    return _pool.submit(_run)
+
+
+def run_startup() -> dict:
+    """Fetch prices and units concurrently and price the units once both are in.
+    Historic data is not part of startup (see prefetch_historic).
+    Returns prices (+ prices_as_of epoch), dataset_version, data_df and per-stage timings (seconds)."""
+    t0 = time.perf_counter()
+    timings = {}
+
+    f_prices = _submit(timings, "prices", get_prices)
+    f_units = _submit(timings, "units", load_units)
+
+    prices = f_prices.result()
+    units_df = f_units.result()
+
+    t1 = time.perf_counter()
+    version, data_df = get_dataset(units_df, prices)
+    timings["pricing"] = time.perf_counter() - t1
+    timings["total"] = time.perf_counter() - t0
+
+    stages = " ".join(f"{k}={v*1000:.0f}ms" for k, v in timings.items())
+    over = " OVER BUDGET" if timings["total"] > STARTUP_BUDGET_S else ""
+    print(f"startup {stages} (budget {STARTUP_BUDGET_S*1000:.0f}ms){over}")
+
+    return {
+        "prices": prices,
+        "prices_as_of": time.time() - (data_age("prices") or 0.0),
+        "dataset_version": version,
+        "data_df": data_df,
+        "timings": timings,
+    }
+
+
+def prefetch_historic():
+    """Warm the historic cache in the background after first paint (once per session).
+    The Trends page then reads it via dataset_store.current_historic()."""
+    if st.session_state.get("_historic_prefetched"):
+        return
+    st.session_state["_historic_prefetched"] = True
+    _submit({}, "historic", lambda: get_historic(load_historic_data()))
@@ -0,0 +1,64 @@
+import time, threading, functools
+from modules.single_flight import single_flight
+
+
+_lock = threading.Lock()
+_entries = {}        # name -> {"value": ..., "fetched_at": epoch seconds}
+_refreshing = set()
+
+
+def _store(name: str, value, fetched_at: float | None = None):
+    with _lock:
+        _entries[name] = {"value": value, "fetched_at": fetched_at or time.time()}
+
+
+def data_age(name: str) -> float | None:
+    """Seconds since the value served under `name` was fetched, None if nothing cached yet."""
+    e = _entries.get(name)
+    return None if e is None else max(time.time() - e["fetched_at"], 0.0)
+
+
+def swr_cache(name: str, ttl: float, seed=None, keep=lambda v: v is not None):
+    """Stale-while-revalidate cache for zero-argument loaders (process-wide).
+    - fresh value: returned as is
+    - stale value: returned immediately, one background refresh is started
+    - no value: `seed()` may provide (value, fetched_at) e.g. from disk; otherwise
+      the loader runs synchronously (single-flight)
+    Results rejected by `keep` are not cached, so the last good value is served."""
+    def deco(fn):
+        def _fetch():
+            value = fn()
+            if keep(value):
+                _store(name, value)
+            return value
+
+        def _refresh():
+            try:
+                single_flight(name, _fetch)
+            except Exception as e:
+                print(f"background refresh failed for {name}: {e}")
+            finally:
+                with _lock:
+                    _refreshing.discard(name)
+
+        @functools.wraps(fn)
+        def wrapper():
+            e = _entries.get(name)
+            if e is None and seed is not None:
+                seeded = seed()
+                if seeded is not None:
+                    _store(name, *seeded)
+                    e = _entries[name]
+            if e is None:
+                return single_flight(name, _fetch)
+
+            if time.time() - e["fetched_at"] > ttl:
+                with _lock:
+                    start = name not in _refreshing
+                    _refreshing.add(name)
+                if start:
+                    threading.Thread(target=_refresh, name=f"swr-{name}", daemon=True).start()
+            return e["value"]
+
+        return wrapper
+    return deco
@@ -1,4 +1,4 @@
-import os, base64
+import os, time, base64
 import streamlit as st
 
 
@@ -27,7 +27,18 @@ logo_loading = load_base64_image(os.path.join(_ASSETS, "ctt-logo.svg"))
 CTA_URL = "https://digitalfinancebriefing.substack.com/?utm_source=ctt_app&utm_medium=sidebar_cta&utm_campaign=subscribe"
 SUPPORT_URL = "https://buymeacoffee.com/cryptotreasurytracker"
 
+def _fmt_age(seconds):
+    if seconds is None:
+        return ""
+    if seconds < 90:
+        return "just now"
+    if seconds < 5400:
+        return f"{seconds/60:.0f} min ago"
+    return f"{seconds/3600:.0f} h ago"
+
 def render_header():
+    as_of = st.session_state.get("prices_as_of")
+    age = _fmt_age(time.time() - as_of if as_of else None)
     btc = st.session_state["prices"][0]
     eth = st.session_state["prices"][1]
     sol = st.session_state["prices"][2]
@@ -70,6 +81,7 @@ def render_header():
         | Powered by
         <img src="data:image/png;base64,{cg_b64}" style="height:20px;vertical-align:middle;margin-top:-3px;margin-left:4px;margin-right:0px;">
         <a href="https://www.coingecko.com/" target="_blank" style="text-decoration:none;color:inherit;">CoinGecko</a>
+        <span style="font-size:0.8rem;color:#888;">{f"&nbsp;· updated {age}" if age else ""}</span>
       </div>
       <div>
         <img src="data:image/svg+xml;base64,{logo_b64}" style="height:35px;vertical-align:middle;">
@@ -0,0 +1,94 @@
+import threading
+from collections import OrderedDict
+
+
+MAX_VIEWS = 64   # filtered views kept across all sessions (least recently used evicted first)
+
+# ---- singletons ----
+# Views are shared by every session, so they are read-only: copy before changing columns.
+_lock = threading.Lock()
+_views = OrderedDict()     # key -> {"view": frame, "derived": {name: artifact}}
+_keys = {}                 # id(view) -> key, to find the entry of a view handed back in
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def cached_view(key: tuple, build):
+    """Return the view stored under key, building (and storing) it on a miss.
+    Keys must include the dataset version so a new dataset never serves old rows."""
+    with _lock:
+        if key in _views:
+            _views.move_to_end(key)
+            _stats["hits"] += 1
+            return _views[key]["view"]
+        _stats["misses"] += 1
+
+    view = build()
+    with _lock:
+        if key not in _views:
+            _views[key] = {"view": view, "derived": {}}
+            _keys[id(view)] = key
+        _views.move_to_end(key)
+        while len(_views) > MAX_VIEWS:
+            _, old = _views.popitem(last=False)
+            _keys.pop(id(old["view"]), None)
+            _stats["evictions"] += 1
+        return _views[key]["view"]
+
+
+def derived(view, name: str, fn):
+    """fn(view), memoized alongside the cached view (and evicted with it).
+    Frames that are not cached views are computed directly."""
+    with _lock:
+        key = _keys.get(id(view))
+        entry = _views.get(key) if key is not None else None
+        if entry is None or entry["view"] is not view:
+            entry = None
+        elif name in entry["derived"]:
+            return entry["derived"][name]
+
+    value = fn(view)
+    if entry is not None:
+        with _lock:
+            entry["derived"].setdefault(name, value)
+    return value
+
+
+def derived_keyed(view, name: str, key, fn):
+    """Like derived, but with one slot per name: the stored fn(view) is reused while `key`
+    is unchanged and replaced when it changes, so parameters (a dataset version, a seed)
+    never pile up entries on a long-lived view."""
+    with _lock:
+        vkey = _keys.get(id(view))
+        entry = _views.get(vkey) if vkey is not None else None
+        if entry is None or entry["view"] is not view:
+            entry = None
+        else:
+            slot = entry["derived"].get(name)
+            if slot is not None and slot[0] == key:
+                return slot[1]
+
+    value = fn(view)
+    if entry is not None:
+        with _lock:
+            entry["derived"][name] = (key, value)
+    return value
+
+
+def derived_view(view, name: str, fn):
+    """fn(view) cached as a view of its own under view's key + (name,), so that
+    artifacts derived from the sub-view are memoized as well. fn must return a new frame.
+    Frames that are not cached views are computed directly."""
+    with _lock:
+        key = _keys.get(id(view))
+        entry = _views.get(key) if key is not None else None
+        if entry is None or entry["view"] is not view:
+            key = None
+    if key is None:
+        return fn(view)
+    return cached_view(key + (name,), lambda: fn(view))
+
+
+def view_stats() -> dict:
+    """Hit/miss/eviction counters and current size of the view cache."""
+    with _lock:
+        return dict(_stats, size=len(_views))
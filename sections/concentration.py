@@ -113,7 +113,7 @@ def render_concentration():
             weight_mode = "USD"
             value_col = "USD Value"
 
-        weights = df_view.groupby(key)[value_col].sum()
+        weights = df_view.groupby(key, observed=True)[value_col].sum()
         # drop zeros/NA
         weights = weights[weights > 0].sort_values(ascending=False)
 
@@ -3,12 +3,13 @@ import pandas as pd
 
 from modules.filters import apply_filters_historic
 from modules.charts import historic_chart, cumulative_market_cap_chart, dominance_area_chart_usd
-from modules.kpi_helpers import render_historic_kpis, render_flow_decomposition
+from modules.kpi_helpers import render_historic_kpis, render_flow_decomposition, render_entity_flow_leaderboard
 from modules.ui import render_plotly
+from modules.dataset_store import current_historic
 
 
 def render_historic_holdings():
-    df = st.session_state["historic_df"]
+    df = current_historic()
     df_filtered = apply_filters_historic(df)
 
     if df_filtered.empty:
@@ -33,6 +34,8 @@ def render_historic_holdings():
 
     render_flow_decomposition(df_filtered)
 
+    render_entity_flow_leaderboard(df_filtered)
+
     with st.container(border=True):
         st.markdown("#### Historic Crypto Treasury Holdings Breakdown", help="Shows the historic development of aggregated and individual crypto asset holdings across all entities")
 
@@ -9,6 +9,7 @@ from modules.kpi_helpers import render_kpis
 from analytics import log_table_render
 from modules.ui import btc_b64, eth_b64, sol_b64, sui_b64, ltc_b64, xrp_b64, hype_b64
 from modules.pdf_helper import _table_pdf_bytes
+from modules.formatting import format_usd, usd_column
 
 # Supply column row-wise
 supply_caps = {
@@ -35,16 +36,6 @@ TRUE_DAT_WHITELIST = {
 }
 
 
-def pretty_usd(x):
-    if pd.isna(x):
-        return "-"
-    ax = abs(x)
-    if ax >= 1e12:  return f"${x/1e12:.2f}T"
-    if ax >= 1e9:  return f"${x/1e9:.2f}B"
-    if ax >= 1e6:  return f"${x/1e6:.2f}M"
-    if ax >= 1e3:  return f"${x/1e3:.2f}K"
-    return f"${x:,.0f}"
-
 def _df_auto_height(n_rows: int, row_px: int = 35) -> int:
     # header ≈ one row + thin borders
     return int((n_rows + 1) * row_px + 3)
@@ -97,6 +88,9 @@ def render_overview():
         st.markdown("#### Crypto Treasury Ranking", help="Ranked view of entities by digital asset treasury holdings.")
 
         table = df.copy()
+        # display labels, formatted once per dataset version
+        table["_usd_label"] = usd_column(df, "USD Value")
+        table["_mcap_label"] = usd_column(df, "Market Cap")
         table = table.sort_values("USD Value", ascending=False).reset_index(drop=True)
         table.index = table.index + 1
         table.index.name = "Rank"
@@ -270,7 +264,7 @@ def render_overview():
             with st.container(border=True):
                 st.metric(
                     "Total Crypto-NAV (selected)",
-                    f"{pretty_usd(nav_total)}",
+                    format_usd(nav_total, decimals=2),
                     help=("Total USD value of selected crypto treasury entities (Crypto-NAV).")
                 )
 
@@ -325,10 +319,10 @@ def render_overview():
             "LTC": f"data:image/png;base64,{ltc_b64}",
             "HYPE": f"data:image/png;base64,{hype_b64}",
         }
-        display["Crypto Asset"] = display["Crypto Asset"].map(lambda a: logo_map.get(a, ""))
+        display["Crypto Asset"] = display["Crypto Asset"].astype(str).map(lambda a: logo_map.get(a, ""))
 
-        display["Market Cap"] = display["Market Cap"].map(pretty_usd)
-        display["USD Value"] = display["USD Value"].map(pretty_usd)
+        display["Market Cap"] = display["_mcap_label"]
+        display["USD Value"] = display["_usd_label"]
 
         display = display[[
             "Entity Name", "Ticker", "Entity Type", "Country",                      # Meta data
@@ -347,7 +341,7 @@ def render_overview():
 
         _badge_map = {k: _badge_svg_uri(k, v, h=28) for k, v in _type_palette.items()}
 
-        display["Entity Type"] = display["Entity Type"].map(
+        display["Entity Type"] = display["Entity Type"].astype(str).map(
             lambda t: _badge_map.get(t, _badge_map["Other"])
         )
 
@@ -18,7 +18,7 @@ def render_treasury_breakdown():
         col1, col2, col3 = st.columns(3)
         total_value = df_filtered['USD Value'].sum()
         entity_count = df_filtered['Entity Name'].nunique()
-        avg_value = df_filtered.groupby('Entity Name')['USD Value'].sum().mean()
+        avg_value = df_filtered.groupby('Entity Name', observed=True)['USD Value'].sum().mean()
 
         with col1:
             with st.container(border=True):
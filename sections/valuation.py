@@ -5,6 +5,12 @@ import pandas as pd
 from modules.filters import apply_filters
 from modules.ui import render_plotly
 from modules import charts
+from modules.formatting import format_usd
+from modules.view_cache import derived_view, derived_keyed
+from modules.nav_matrix import get_nav_matrix
+from modules.entity_snapshot import get_entity_snapshot
+from modules.monte_carlo import get_return_model, simulate, tail_stats
+from modules.dataset_store import current_historic
 from sections.overview import TRUE_DAT_WHITELIST
 
 def render_valuation_insights():
@@ -15,12 +21,9 @@ def render_valuation_insights():
         st.info("No data for current filters.")
         return
 
-    # Snapshot KPI block
-    snap = (df_filtered.groupby("Entity Name", as_index=False)
-              .agg(CryptoNAV=("USD Value","sum"),
-                   MarketCap=("Market Cap","max")))
-    snap = snap.dropna(subset=["MarketCap"])
-    snap = snap[snap["MarketCap"] > 0]
+    # Snapshot KPI block (shared entity snapshot of the filtered view)
+    snap_full = get_entity_snapshot(df_filtered)
+    snap = snap_full[snap_full["MarketCap"] > 0]   # also drops NaN market caps
     total_mcap = float(snap["MarketCap"].sum())
     total_nav  = float(snap["CryptoNAV"].sum())
     exposure   = (total_nav / total_mcap * 100.0) if total_mcap > 0 else 0.0
@@ -28,10 +31,8 @@ def render_valuation_insights():
     # Premium (portfolio-weighted if available)
     prem = st.session_state.get("has_premium", False)
     if ("Premium %" in df_filtered.columns) or ("MNAV" in df_filtered.columns):
-        # compute from charts helper for consistency
-        _snap_full = charts._entity_snapshot(df_filtered)
-        w = np.where(_snap_full["MarketCap"] > 0, _snap_full["MarketCap"], 0.0)
-        pw_prem = np.nansum((_snap_full["Premium %"] * w)) / np.sum(w) if np.sum(w) > 0 else np.nan
+        w = np.where(snap_full["MarketCap"] > 0, snap_full["MarketCap"], 0.0)
+        pw_prem = np.nansum((snap_full["Premium %"] * w)) / np.sum(w) if np.sum(w) > 0 else np.nan
     else:
         pw_prem = np.nan
 
@@ -47,70 +48,88 @@ def render_valuation_insights():
         with st.container(border=True):
             st.metric("Portfolio Exposure (cap-weighted)", f"{exposure:.1f}%", help="Share of corporate market cap represented by crypto assets. Higher values indicate greater market sensitivity to crypto price movements.")
 
-    # Row of charts
+    # Row of charts (each block is a fragment: its controls rerun only that block)
     c1, c2 = st.columns([1,1])
-    
+
     with c1:
-        with st.container(border=True):
-            st.markdown("#### Exposure Ladder", help="Treasury as a % of Market Cap; higher value means more crypto-sensitive.")
-            sub_c1, sub_c2 = st.columns([3,1])
+        _exposure_ladder_block(df_filtered)
 
-            top_n = sub_c1.number_input(
-                "Top N (by Crypto Exposure)", 5, 50, 20, key="exp_topn",
-                help="Number of entities to display, sorted by Exposure (%)."
-            )
-            datco_only_exp = sub_c2.checkbox(
-                "DATCOs only", value=True, key="ladder_datco_only",
-                help="Restrict to Digital Asset Treasury Companies only."
-            )
+    with c2:
+        _mcap_decomposition_block(df_filtered)
 
-            # build dataframe AFTER controls, then render regardless of checkbox
-            df_ladder = df_filtered.copy()
-            if datco_only_exp:
-                assets_sel = sorted(df_ladder["Crypto Asset"].dropna().unique().tolist())
-                active_whitelist = set().union(*(TRUE_DAT_WHITELIST.get(a, set()) for a in assets_sel)) if assets_sel else set()
-                names = df_ladder["Entity Name"].astype(str)
-                df_ladder = df_ladder[names.isin(active_whitelist)]
 
-            if df_ladder.empty:
-                st.info("No data for the current selection.")
-            else:
-                fig1 = charts.exposure_ladder_bar(df_ladder, top_n=int(top_n))
-                render_plotly(fig1, "exposure_ladder", width="stretch")
+    # Optional weighted premium info
+    if np.isfinite(pw_prem):
+        st.caption(f"Weighted Premium to MNAV (by Market Cap): **{pw_prem:.1f}%**")
 
 
-    with c2:
-        with st.container(border=True):
-            st.markdown("#### Market Cap Decomposition", help="Stacked Market Cap split into Crypto-NAV and a residual Core Proxy.")
-            
-            sub_c3, sub_c4 = st.columns([3,1])
+    _mnav_benchmarking_block(df_filtered)
 
-            top_n2 = sub_c3.number_input("Top N (by Market Cap)", 5, 50, 20, key="mcapdec_topn",
-                                    help="Number of entities to display, sorted by Market Cap (USD).")
+    _price_sensitivity_block(df_filtered)
 
-            datco_only_dec = sub_c4.checkbox("DATCOs only", value=True, key="dec_datco_only",
-                                        help="Restrict to Digital Asset Treasury Companies only.")
+    _monte_carlo_block(df_filtered)
 
-            df_dec = df_filtered.copy()
-            if datco_only_dec:
-                assets_sel = sorted(df_dec["Crypto Asset"].dropna().unique().tolist())
-                active_whitelist = set().union(*(TRUE_DAT_WHITELIST.get(a, set()) for a in assets_sel)) if assets_sel else set()
-                names = df_dec["Entity Name"].astype(str)
-                df_dec = df_dec[names.isin(active_whitelist)]
 
-            if df_dec.empty:
-                st.info("No data for the current selection.")
-            else:
-                fig3 = charts.mcap_decomposition_bar(df_dec, top_n=top_n2)
-                render_plotly(fig3, "mcap_decomposition", width="stretch")
+def _datco_only(df_filtered: pd.DataFrame) -> pd.DataFrame:
+    """Rows of whitelisted DATCOs for the assets in the view; a cached view of its own,
+    so chart inputs derived from it (e.g. the NAV matrix) are memoized too."""
+    def build(d):
+        assets_sel = sorted(d["Crypto Asset"].dropna().unique().tolist())
+        active_whitelist = set().union(*(TRUE_DAT_WHITELIST.get(a, set()) for a in assets_sel)) if assets_sel else set()
+        names = d["Entity Name"].astype(str)
+        return d[names.isin(active_whitelist)]
+    return derived_view(df_filtered, "datco_only", build)
 
 
-    # Optional weighted premium info
-    if np.isfinite(pw_prem):
-        st.caption(f"Weighted Premium to MNAV (by Market Cap): **{pw_prem:.1f}%**")
+@st.fragment
+def _exposure_ladder_block(df_filtered: pd.DataFrame):
+    with st.container(border=True):
+        st.markdown("#### Exposure Ladder", help="Treasury as a % of Market Cap; higher value means more crypto-sensitive.")
+        sub_c1, sub_c2 = st.columns([3,1])
+
+        top_n = sub_c1.number_input(
+            "Top N (by Crypto Exposure)", 5, 50, 20, key="exp_topn",
+            help="Number of entities to display, sorted by Exposure (%)."
+        )
+        datco_only_exp = sub_c2.checkbox(
+            "DATCOs only", value=True, key="ladder_datco_only",
+            help="Restrict to Digital Asset Treasury Companies only."
+        )
+
+        # build dataframe AFTER controls, then render regardless of checkbox
+        df_ladder = _datco_only(df_filtered) if datco_only_exp else df_filtered
+
+        if df_ladder.empty:
+            st.info("No data for the current selection.")
+        else:
+            fig1 = charts.exposure_ladder_bar(df_ladder, top_n=int(top_n))
+            render_plotly(fig1, "exposure_ladder", width="stretch")
 
 
-    # --- mNAV comparison ---
+@st.fragment
+def _mcap_decomposition_block(df_filtered: pd.DataFrame):
+    with st.container(border=True):
+        st.markdown("#### Market Cap Decomposition", help="Stacked Market Cap split into Crypto-NAV and a residual Core Proxy.")
+
+        sub_c3, sub_c4 = st.columns([3,1])
+
+        top_n2 = sub_c3.number_input("Top N (by Market Cap)", 5, 50, 20, key="mcapdec_topn",
+                                help="Number of entities to display, sorted by Market Cap (USD).")
+
+        datco_only_dec = sub_c4.checkbox("DATCOs only", value=True, key="dec_datco_only",
+                                    help="Restrict to Digital Asset Treasury Companies only.")
+
+        df_dec = _datco_only(df_filtered) if datco_only_dec else df_filtered
+
+        if df_dec.empty:
+            st.info("No data for the current selection.")
+        else:
+            fig3 = charts.mcap_decomposition_bar(df_dec, top_n=top_n2)
+            render_plotly(fig3, "mcap_decomposition", width="stretch")
+
+
+@st.fragment
+def _mnav_benchmarking_block(df_filtered: pd.DataFrame):
     with st.container(border=True):
         st.markdown("#### mNAV Benchmarking", help="Premium/discount vs the crypto treasury. 1× is parity; above 1× = premium, below 1× = discount.")
 
@@ -124,24 +143,11 @@ def render_valuation_insights():
         datco_only_mnav = c1.checkbox("DATCOs only (mNAV)", value=True, help="Limit to verified Direct-Asset Treasury Companies.")
 
         # Filter dataset for chart/KPIs
-        df_mnav = df_filtered.copy()
-        if datco_only_mnav:
-            assets_sel = sorted(df_mnav["Crypto Asset"].dropna().unique().tolist())
-            active_whitelist = set().union(*(TRUE_DAT_WHITELIST.get(a, set()) for a in assets_sel)) if assets_sel else set()
-            names = df_mnav["Entity Name"].astype(str)
-            df_mnav = df_mnav[names.isin(active_whitelist)]
-
+        df_mnav = _datco_only(df_filtered) if datco_only_mnav else df_filtered
 
         # Compute mNAV series for KPIs (respect the same cap rule)
-        snap_for_kpi = charts._entity_snapshot(df_mnav).dropna(subset=["MarketCap"])
-        snap_for_kpi = snap_for_kpi[snap_for_kpi["MarketCap"] > 0].copy()
-
-        with np.errstate(divide="ignore", invalid="ignore"):
-            snap_for_kpi["mNAV"] = np.where(
-                snap_for_kpi["CryptoNAV"] > 0,
-                snap_for_kpi["MarketCap"] / snap_for_kpi["CryptoNAV"],
-                np.nan,
-            )
+        snap_for_kpi = get_entity_snapshot(df_mnav)
+        snap_for_kpi = snap_for_kpi[snap_for_kpi["MarketCap"] > 0]
 
         # apply mNAV cap BEFORE picking Top-N (same as chart)
         if cap_outliers:
@@ -191,53 +197,50 @@ def render_valuation_insights():
             render_plotly(fig_mnav, "mnav_comparison", width="stretch")
 
 
-    def _shock_controls(df_filtered: pd.DataFrame):
-        assets = sorted(df_filtered["Crypto Asset"].dropna().unique().tolist())
+def _shock_controls(df_filtered: pd.DataFrame):
+    assets = sorted(df_filtered["Crypto Asset"].dropna().unique().tolist())
 
-        c1, c2, c3, c4 = st.columns([1,1,1,0.5])
+    c1, c2, c3, c4 = st.columns([1,1,1,0.5])
 
-        datco_only = c4.checkbox(
-            "DATCOs only",
-            value=True,
-            help="Restrict to verified Direct-Asset Treasury Companies."
-        )        
+    datco_only = c4.checkbox(
+        "DATCOs only",
+        value=True,
+        help="Restrict to verified Direct-Asset Treasury Companies."
+    )        
 
-        mode = c1.radio(
-            "Shock mode",
-            ["Uniform (all selected assets)", "Per-asset"],
-            index=0,
-            horizontal=True,
-            help="Apply one %-change to all selected assets, or specify a separate %-change per crypto asset.",
-        )
-
-        top_n = c3.number_input("Top N (by Crypto Exposure)", 5, 50, 20,  help="Number of entities to display, sorted by Exposure (%).")
+    mode = c1.radio(
+        "Shock mode",
+        ["Uniform (all selected assets)", "Per-asset"],
+        index=0,
+        horizontal=True,
+        help="Apply one %-change to all selected assets, or specify a separate %-change per crypto asset.",
+    )
 
-        if mode.startswith("Uniform"):
-            pct = c2.slider("Adjust crypto price shock (%)", -50, 50, value=-5, step=1,format="%d%%",
-                            help="Apply price shock as %-change to all selected crypto assets.")
-            return {"uniform": pct / 100.0, "overrides": None}, top_n, datco_only
-        else:
-            cols = st.columns(min(3, max(1, len(assets))))
-            shocks = {}
-            for i, a in enumerate(assets):
-                shocks[a] = cols[i % len(cols)].slider(
-                    f"{a} shock", -50, 50, value=0, step=1,
-                    help=f"{a} price change in %."
-                ) / 100.0
-            return {"uniform": None, "overrides": shocks}, top_n, datco_only
+    top_n = c3.number_input("Top N (by Crypto Exposure)", 5, 50, 20,  help="Number of entities to display, sorted by Exposure (%).")
 
+    if mode.startswith("Uniform"):
+        pct = c2.slider("Adjust crypto price shock (%)", -50, 50, value=-5, step=1,format="%d%%",
+                        help="Apply price shock as %-change to all selected crypto assets.")
+        return {"uniform": pct / 100.0, "overrides": None}, top_n, datco_only
+    else:
+        cols = st.columns(min(3, max(1, len(assets))))
+        shocks = {}
+        for i, a in enumerate(assets):
+            shocks[a] = cols[i % len(cols)].slider(
+                f"{a} shock", -50, 50, value=0, step=1,
+                help=f"{a} price change in %."
+            ) / 100.0
+        return {"uniform": None, "overrides": shocks}, top_n, datco_only
+
+
+@st.fragment
+def _price_sensitivity_block(df_filtered: pd.DataFrame):
     with st.container(border=True):
         st.markdown("#### Price Sensitivity to Crypto (NAV-Implied β)", help="Computes the Δ Market Cap (Equity) implied by crypto price shocks. Assumes 1:1 pass-through of Crypto-NAV changes; core business unchanged; not a historical beta.")
 
         cfg, top_n, datco_only = _shock_controls(df_filtered)
 
-        df_sens = df_filtered.copy()
-        if datco_only:
-            assets_sel = sorted(df_sens["Crypto Asset"].dropna().unique().tolist())
-            active_whitelist = set().union(*(TRUE_DAT_WHITELIST.get(a, set()) for a in assets_sel)) if assets_sel else set()
-            names = df_sens["Entity Name"].astype(str)
-            df_sens = df_sens[names.isin(active_whitelist)]
-
+        df_sens = _datco_only(df_filtered) if datco_only else df_filtered
 
         if df_sens.empty:
             st.info("No DATCOs in the current selection.")
@@ -252,3 +255,58 @@ def render_valuation_insights():
             "Method: ΔEquity ≈ Σ(Crypto-NAV × price shock) / Market Cap. "
             "Assumes share count is constant and market cap adjusts one-for-one to Crypto-NAV changes."
         )
+
+
+@st.fragment
+def _monte_carlo_block(df_filtered: pd.DataFrame):
+    with st.container(border=True):
+        st.markdown("#### Monte Carlo Price Scenarios", help="Draws correlated crypto price scenarios from the monthly returns implied by the historic treasury data (USD Value / units) and shows the range of implied equity moves per company.")
+
+        c1, c2, c3, c4, c5 = st.columns([1,1,1,1,0.5])
+        n_draws = c1.selectbox("Draws", [5_000, 10_000, 20_000, 50_000], index=2, format_func=lambda n: f"{n:,}")
+        horizon = c2.slider("Horizon (months)", 1, 12, value=1, step=1)
+        top_n = c3.number_input("Top N (by tail risk)", 5, 50, 20, key="mc_topn",
+                                help="Entities with the most negative expected shortfall.")
+        seed = c4.number_input("Seed", 0, 1_000_000, 42, step=1, help="Same seed, same scenarios.")
+        datco_only = c5.checkbox("DATCOs only", value=True, key="mc_datco_only",
+                                 help="Restrict to verified Direct-Asset Treasury Companies.")
+
+        df_mc = _datco_only(df_filtered) if datco_only else df_filtered
+        nav = get_nav_matrix(df_mc)
+        if nav.empty:
+            st.info("No data for the current selection.")
+            return
+
+        with st.spinner("Loading price history…"):
+            model = get_return_model(current_historic())
+        if len(model.assets) == 0:
+            st.info("Not enough price history for a simulation.")
+            return
+
+        # one simulation per view and settings: reruns for e.g. Top N reuse it
+        key = (st.session_state.get("historic_version"), int(n_draws), int(horizon), int(seed), bool(datco_only))
+        table, total = derived_keyed(
+            df_filtered, "monte_carlo", key,
+            lambda d: simulate(nav, model, n_draws=int(n_draws), horizon=int(horizon), seed=int(seed)),
+        )
+
+        k1, k2, k3 = st.columns(3)
+        (p5, p50), es = tail_stats(total, (5, 50), 0.05)
+        with k1:
+            with st.container(border=True):
+                st.metric("Median ΔCrypto-NAV (selected)", format_usd(p50))
+        with k2:
+            with st.container(border=True):
+                st.metric("5th percentile ΔCrypto-NAV", format_usd(p5))
+        with k3:
+            with st.container(border=True):
+                st.metric("Expected Shortfall (5%)", format_usd(es), help="Average ΔCrypto-NAV across the worst 5% of scenarios.")
+
+        fig = charts.monte_carlo_range_bar(table, top_n=int(top_n))
+        render_plotly(fig, "monte_carlo_scenarios", width="stretch")
+
+        st.caption(
+            f"Method: joint normal monthly log returns estimated from {model.n_obs} months of implied prices, "
+            "scaled to the horizon without drift; assets without history are held constant. "
+            "ΔEquity as in the sensitivity chart above (1:1 pass-through of Crypto-NAV changes)."
+        )
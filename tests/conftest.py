@@ -0,0 +1,4 @@
+import os, sys
+
+# tests import the app's modules package from the repo root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
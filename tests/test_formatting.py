@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+from modules.formatting import usd_labels, format_usd
+
+
+@pytest.mark.parametrize("value", [999.5, 999.6, 999.7, 999.99])
+def test_rounds_up_to_one_thousand(value):
+    assert format_usd(value) == "$1,000"
+    assert usd_labels([value], 2)[0] == "$1,000"
+
+
+def test_negative_one_thousand():
+    assert format_usd(-999.7) == "$-1,000"
+
+
+def test_mixed_array():
+    out = usd_labels([999.4, 999.6, 1000.0, 2.5e6, None], 1)
+    assert list(out) == ["$999", "$1,000", "$1.0K", "$2.5M", "-"]
+    assert out.dtype == np.dtype(object)
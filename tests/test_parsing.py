@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+from modules.parsing import parse_numbers
+
+
+def _auto(cells):
+    values, rejected = parse_numbers(pd.Series(cells, dtype=object), "auto", return_rejected=True)
+    return values.tolist(), rejected.tolist()
+
+
+def test_plain_cells_survive_eu_majority():
+    values, rejected = _auto(["1.234,5", "2.345,75", "1,5", "2.5", "1.234"])
+    assert values == [1234.5, 2345.75, 1.5, 2.5, 1234.0]
+    assert rejected == []
+
+
+def test_us_format_is_recognized():
+    values, _ = _auto(["1,234.5", "1,234,567", "1,234", "2.5", "1.234"])
+    assert values == [1234.5, 1234567.0, 1234.0, 2.5, 1.234]
+
+
+def test_mixed_numeric_text_and_na_cells():
+    values, rejected = _auto([7, "$ 1,000.50", "n/a", "", "abc", "3,25"])
+    assert values[:2] == [7.0, 1000.5]
+    assert np.isnan(values[2]) and np.isnan(values[3]) and np.isnan(values[4])
+    assert values[5] == 3.25
+    assert rejected == [4]
+
+
+@pytest.mark.parametrize("fmt, cells, expected", [
+    ("eu", ["1.234,5", "2,5"], [1234.5, 2.5]),
+    ("us", ["1,234.5", "2.5"], [1234.5, 2.5]),
+    ("plain", ["2.5", "1e3"], [2.5, 1000.0]),
+])
+def test_explicit_formats(fmt, cells, expected):
+    assert parse_numbers(pd.Series(cells, dtype=object), fmt).tolist() == expected